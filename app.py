@@ -1,3 +1,8 @@
+import functools
+import importlib
+import multiprocessing
+
+from PyQt5.QtCore import QObject, pyqtSignal
 from PyQt5.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -6,10 +11,35 @@ from PyQt5.QtWidgets import (
     QWidget,
     QLabel,
 )
-import transformers
-from game_getter import GameGetter
+from jobs import JobQueue
+
+
+# transformers and game_getter pull in pandas, requests_html and aiohttp, so
+# they are only imported once a button needs them
+def transform(name):
+    return lambda: getattr(importlib.import_module("transformers"), name)()
+
+
+@functools.cache
+def get_game_getter():
+    from game_getter import GameGetter
+
+    return GameGetter()
+
+
+def scrape(name):
+    return lambda: getattr(get_game_getter(), name)()
+
+
+def describe(progress):
+    return ", ".join(
+        f"{key.replace('_', ' ')}: {value}" for key, value in progress.items()
+    )
+
 
-game_getter = GameGetter()
+class JobSignals(QObject):
+    # Jobs change on the worker thread; the signal hands them to the GUI thread
+    changed = pyqtSignal(object)
 
 
 class MainWindow(QMainWindow):
@@ -21,6 +51,11 @@ class MainWindow(QMainWindow):
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
 
+        # Jobs run one at a time on a worker thread so the window stays live
+        self.signals = JobSignals()
+        self.signals.changed.connect(self.show_job)
+        self.jobs = JobQueue(self.signals.changed.emit)
+
         layout = QVBoxLayout()
 
         # Add a label and buttons for Transform Options
@@ -28,13 +63,22 @@ class MainWindow(QMainWindow):
         self.add_button(
             layout,
             "Perform All Transformations",
-            transformers.perform_all_transformations,
+            transform("perform_all_transformations"),
+        )
+        self.add_button(
+            layout, "Update Transformations", transform("update_transformations")
         )
-        self.add_button(layout, "Expand Team Stats", transformers.expand_team_stats)
-        self.add_button(layout, "Split Team Stats", transformers.split_team_stats)
-        self.add_button(layout, "Stagger Team Stats", transformers.stagger_team_stats)
+        self.add_button(layout, "Expand Team Stats", transform("expand_team_stats"))
+        self.add_button(layout, "Split Team Stats", transform("split_team_stats"))
+        self.add_button(layout, "Stagger Team Stats", transform("stagger_team_stats"))
         self.add_button(
-            layout, "Preprocess Team Stats", transformers.preprocess_team_stats
+            layout, "Preprocess Team Stats", transform("preprocess_team_stats")
+        )
+        self.add_button(layout, "Refresh Team Names", transform("refresh_team_names"))
+        self.add_button(
+            layout,
+            "Transform Player Stats",
+            transform("perform_player_transformations"),
         )
 
         # Add a separator label
@@ -42,21 +86,51 @@ class MainWindow(QMainWindow):
 
         # Add a label and buttons for Scrape Options
         layout.addWidget(QLabel("Scrape Options"))
-        self.add_button(layout, "Get All Games", game_getter.get_all_games)
+        self.add_button(layout, "Get All Games", scrape("get_all_games"))
         self.add_button(
-            layout, "Get Most Recent Games", game_getter.get_most_recent_games
+            layout, "Get Most Recent Games", scrape("get_most_recent_games")
         )
+        self.add_button(layout, "Re-parse Cached Games", scrape("reparse_all_games"))
+
+        # Add the job status and a way to stop it
+        layout.addWidget(QLabel("------"))
+        self.status_label = QLabel("Idle")
+        self.progress_label = QLabel("")
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.progress_label)
+        cancel_button = QPushButton("Cancel")
+        cancel_button.clicked.connect(lambda: self.jobs.cancel())
+        layout.addWidget(cancel_button)
 
         # Set the layout to the central widget
         self.central_widget.setLayout(layout)
 
     def add_button(self, layout, text, function):
         button = QPushButton(text)
-        button.clicked.connect(function)
+        # clicked passes a `checked` flag, which would land in optional params
+        button.clicked.connect(lambda: self.jobs.submit(text, function))
         layout.addWidget(button)
 
+    def show_job(self, job):
+        # A newly queued job shouldn't hide the one that is running
+        job = self.jobs.running or job
+        status = f"{job.name}: {job.state}"
+        if job.error is not None:
+            status += f" ({job.error!r})"
+        if self.jobs.pending:
+            status += f", {len(self.jobs.pending)} queued"
+
+        self.status_label.setText(status)
+        self.progress_label.setText(describe(job.progress))
+
+    def closeEvent(self, event):
+        self.jobs.close()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
+    # Game pages are parsed in worker processes, which frozen builds must allow
+    multiprocessing.freeze_support()
     app = QApplication([])
     window = MainWindow()
     window.show()
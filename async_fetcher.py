@@ -0,0 +1,120 @@
+import asyncio
+import time
+from typing import Callable
+
+import aiohttp
+
+import jobs
+import metrics
+from throttle import RequestThrottle, parse_retry_after, retry_statuses
+
+
+class AsyncFetcher:
+    def __init__(
+        self,
+        max_connections_per_host: int = 8,
+        max_connections: int = 64,
+        timeout: float = 30,
+        keepalive_timeout: float = 30,
+        throttle: RequestThrottle | None = None,
+    ):
+        self.max_connections_per_host = max_connections_per_host
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.throttle = throttle or RequestThrottle(
+            max_concurrency=max_connections_per_host
+        )
+
+    def fetch_all(
+        self,
+        urls: list[str],
+        handle_page: Callable[[str, str], object],
+        handle_error: Callable[[str, Exception], object] | None = None,
+    ):
+        # Pages are handed to `handle_page(url, html)` as soon as they arrive,
+        # in a worker thread so parsing never stalls the event loop.
+        # Results come back in completion order. With `handle_error`, a failed
+        # url is reported to it instead of aborting the whole run.
+        return asyncio.run(self._fetch_all(urls, handle_page, handle_error))
+
+    async def _fetch_all(self, urls, handle_page, handle_error):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
+            tasks = [
+                asyncio.create_task(
+                    self._fetch_and_handle(session, url, handle_page, handle_error)
+                )
+                for url in urls
+            ]
+
+            results = []
+            try:
+                # Progress is shown by the caller, which knows the seasons
+                for task in asyncio.as_completed(tasks):
+                    results.append(await task)
+            except BaseException:
+                # Stop the other downloads before the session closes under them
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+        return results
+
+    async def _fetch_and_handle(self, session, url, handle_page, handle_error):
+        try:
+            html = await self.fetch(session, url)
+            return await asyncio.to_thread(handle_page, url, html)
+        except Exception as error:
+            if handle_error is None:
+                raise
+            return handle_error(url, error)
+
+    async def fetch(self, session: aiohttp.ClientSession, url: str) -> str:
+        # The session timeout applies to every attempt on its own
+        for attempt in range(self.throttle.max_retries + 1):
+            jobs.check_cancelled()
+            await self.throttle.wait_async()
+            started = time.perf_counter()
+            try:
+                async with session.get(url) as response:
+                    html = await response.text()
+                    size = len(await response.read())
+            except Exception as error:
+                self.throttle.failed()
+                metrics.request(time.perf_counter() - started, error=error)
+                retryable = isinstance(
+                    error, (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+                )
+                if not retryable or attempt == self.throttle.max_retries:
+                    raise
+                metrics.count("retries", reason=type(error).__name__)
+                await asyncio.sleep(self.throttle.retry_delay(attempt))
+                continue
+            except BaseException:
+                # Cancelled mid-request, so the slot would never come back
+                self.throttle.release()
+                raise
+
+            metrics.request(time.perf_counter() - started, response.status, size)
+            if response.status in retry_statuses:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                self.throttle.failed(retry_after, throttled=response.status == 429)
+                if attempt == self.throttle.max_retries:
+                    response.raise_for_status()
+                metrics.count("retries", reason=response.status)
+                await asyncio.sleep(self.throttle.retry_delay(attempt, retry_after))
+                continue
+
+            self.throttle.succeeded(time.perf_counter() - started)
+            response.raise_for_status()
+            return html
@@ -0,0 +1,482 @@
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pandas as pd
+from requests_html import HTMLSession
+
+import jobs
+import transformers
+from benchmark_parsers import compare_parsers
+from async_fetcher import AsyncFetcher
+from benchmark_transformers import synthetic_team_stats
+from compact import compact_frame, memory_mb, player_schema, team_schema
+from game_getter import GameGetter, Page, parse_game_links, parse_stats
+from manifest import DONE, FAILED
+from throttle import RequestThrottle
+
+fixtures_dir = Path(__file__).parent / "res" / "fixtures"
+
+# A timing counts as a regression once it is this much slower than baseline
+regression_tolerance = 0.25
+
+
+def best_of(function, *args, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def record_fixture(url: str, name: str, directory: Path = fixtures_dir) -> Path:
+    # Saves a live footballdb page so it can be benchmarked offline
+    res = HTMLSession().get(url)
+    res.raise_for_status()
+
+    path = directory / f"{name}.html"
+    path.write_text(res.text, encoding="utf-8")
+    return path
+
+
+def benchmark_parse(directory: Path = fixtures_dir, repeat: int = 5) -> dict:
+    boxscores = {
+        path.as_uri(): path.read_text(encoding="utf-8")
+        for path in sorted(directory.glob("boxscore_*.html"))
+    }
+
+    pages = {}
+    for url, html in boxscores.items():
+        team_stats, team_s = best_of(
+            lambda: GameGetter.get_team_stats(Page(html, url)), repeat=repeat
+        )
+        _, player_s = best_of(
+            lambda: GameGetter.get_player_stats(Page(html, url), team_stats),
+            repeat=repeat,
+        )
+        _, lxml_s = best_of(parse_stats, url, html, "lxml", repeat=repeat)
+
+        pages[Path(url).stem] = {
+            "team_stats_ms": 1000 * team_s,
+            "player_stats_ms": 1000 * player_s,
+            "lxml_ms": 1000 * lxml_s,
+        }
+
+    schedules = {}
+    for path in sorted(directory.glob("schedule_*.html")):
+        html = path.read_text(encoding="utf-8")
+        links, links_s = best_of(
+            lambda: parse_game_links(Page(html, path.as_uri())), repeat=repeat
+        )
+        schedules[path.stem] = {"games": len(links), "game_links_ms": 1000 * links_s}
+
+    parity = compare_parsers(boxscores, repeat=1)
+
+    return {
+        "pages": pages,
+        "schedules": schedules,
+        "requests_html_ms": sum(
+            page["team_stats_ms"] + page["player_stats_ms"] for page in pages.values()
+        ),
+        "lxml_ms": sum(page["lxml_ms"] for page in pages.values()),
+        "parsers_agree": not parity["mismatches"] and not parity["errors"],
+    }
+
+
+class RateLimitedServer(ThreadingHTTPServer):
+    # Stands in for footballdb: answers 429 with Retry-After once clients go
+    # over `rate` requests a second, and makes some responses slow
+    daemon_threads = True
+
+    def __init__(self, rate: float, slow_fraction: float, slow_s: float):
+        super().__init__(("127.0.0.1", 0), RateLimitedHandler)
+        self.rate = rate
+        self.slow_fraction = slow_fraction
+        self.slow_s = slow_s
+        self.schedule = (fixtures_dir / "schedule_season.html").read_bytes()
+        self.boxscore = (fixtures_dir / "boxscore_regular_season.html").read_bytes()
+        self.lock = threading.Lock()
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def allow(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class RateLimitedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if not self.server.allow():
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if random.random() < self.server.slow_fraction:
+            time.sleep(self.server.slow_s)
+
+        body = (
+            self.server.schedule
+            if self.path.startswith("/games/index.html")
+            else self.server.boxscore
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def benchmark_requests(
+    pages: int = 150,
+    server_rate: float = 10.0,
+    slow_fraction: float = 0.05,
+    slow_s: float = 3.0,
+) -> dict:
+    # Downloads through both engines from a local server that rate limits and
+    # stalls, to check that no page is lost and the throttle settles near the
+    # server's limit
+    server = RateLimitedServer(server_rate, slow_fraction, slow_s)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    summary = {"pages": pages, "server_rate": server_rate}
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            getter = GameGetter(
+                base_url=server.url,
+                cache_dir=None,
+                manifest_path=os.path.join(directory, "manifest.db"),
+            )
+            urls = [f"{server.url}/games/boxscore/{i}" for i in range(pages)]
+
+            def download(url):
+                try:
+                    return getter.download(url) is not None
+                except Exception:
+                    return False
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(getter.throttle.max_concurrency) as executor:
+                downloaded = sum(executor.map(download, urls))
+            summary["thread"] = throttle_summary(
+                getter.throttle, downloaded, time.perf_counter() - started
+            )
+            getter.manifest.close()
+
+        throttle = RequestThrottle()
+        fetched, failed = [], []
+        started = time.perf_counter()
+        AsyncFetcher(throttle=throttle).fetch_all(
+            urls,
+            lambda url, html: fetched.append(url),
+            lambda url, error: failed.append(url),
+        )
+        summary["async"] = throttle_summary(
+            throttle, len(fetched), time.perf_counter() - started
+        )
+
+        # Abort part way while other requests are in flight, as cancelling a
+        # job does, and check every one of them gave its slot back
+        throttle = RequestThrottle()
+        handled = []
+
+        def cancel_after_some(url, html):
+            handled.append(url)
+            if len(handled) >= 10 and throttle._in_flight:
+                raise jobs.JobCancelled()
+
+        try:
+            AsyncFetcher(throttle=throttle).fetch_all(urls, cancel_after_some)
+        except jobs.JobCancelled:
+            pass
+        summary["aborted_in_flight"] = throttle._in_flight
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    summary["lost"] = sum(
+        pages - summary[engine]["pages"] for engine in ("thread", "async")
+    )
+    return summary
+
+
+def throttle_summary(throttle: RequestThrottle, pages: int, elapsed: float) -> dict:
+    return {
+        "pages": pages,
+        "requests": throttle.requests,
+        "retries": throttle.retries,
+        "throttled": throttle.throttled,
+        "pages_per_second": pages / elapsed,
+        "settled_rate": throttle.rate,
+        "settled_concurrency": int(throttle.concurrency),
+    }
+
+
+def benchmark_resume() -> dict:
+    # Scrapes two seasons offline from a page cache missing one game of the
+    # earlier season, then caches that game and runs again. The second run
+    # has to go back to the earlier season, as the later one is all saved
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            os.chdir(directory)
+            getter = GameGetter(
+                cache_dir="page_cache",
+                offline=True,
+                parser="lxml",
+                parse_workers=1,
+                manifest_path="manifest.db",
+            )
+            schedule = (fixtures_dir / "schedule_season.html").read_text()
+            boxscore = (fixtures_dir / "boxscore_regular_season.html").read_text()
+            months = ["September", "October", "November", "December"]
+
+            pages = {}
+            for year in (getter.current_season - 1, getter.current_season):
+                url = f"{getter.base_url}/games/index.html?lg=NFL&yr={year}"
+                html = schedule.replace("1985", str(year))
+                getter.cache.put(url, html)
+                links = parse_game_links(Page(html, url))
+                for i, game_url in enumerate(links):
+                    # Distinct dates keep every game apart in the stats files
+                    date = f"{months[i // 28]} {i % 28 + 1}, {year}"
+                    pages[f"{getter.base_url}{game_url}"] = boxscore.replace(
+                        "December 2, 1985", date
+                    )
+
+            missing = next(iter(pages))
+            for url, html in pages.items():
+                if url != missing:
+                    getter.cache.put(url, html)
+
+            # As if an earlier scrape had listed the earlier season's games
+            getter.get_season_game_links(getter.current_season - 1)
+            getter.get_most_recent_games()
+            failed_first = len(getter.manifest.games(getter.current_season - 1, FAILED))
+            getter.cache.put(missing, pages[missing])
+            getter.get_most_recent_games()
+
+            unsaved = getter.manifest.connection.execute(
+                "SELECT COUNT(*) FROM games WHERE status != ?", (DONE,)
+            ).fetchone()[0]
+            saved_rows = len(pd.read_csv("team_stats.csv"))
+            getter.manifest.close()
+            return {
+                "games": len(pages),
+                "failed_first_run": failed_first,
+                "unsaved_after_retry": unsaved,
+                "saved_rows": saved_rows,
+            }
+        finally:
+            os.chdir(cwd)
+
+
+def benchmark_transform(seasons: int | None = None, store: str = "csv") -> dict:
+    team_stats = synthetic_team_stats(seasons)
+    stages = {
+        "expand": transformers.expand_team_stats,
+        "split": transformers.split_team_stats,
+        "stagger": transformers.stagger_team_stats,
+        "preprocess": transformers.preprocess_team_stats,
+    }
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            # The transformers read and write relative to the working directory
+            os.chdir(directory)
+            team_stats.to_csv("team_stats.csv")
+
+            summary = {"games": len(team_stats), "store": store}
+            for name, stage in stages.items():
+                _, stage_s = best_of(stage, store, repeat=1)
+                summary[f"{name}_s"] = stage_s
+            summary["total_s"] = sum(summary[f"{name}_s"] for name in stages)
+            summary["games_per_s"] = len(team_stats) / summary["total_s"]
+            return summary
+        finally:
+            os.chdir(cwd)
+
+
+# Runs in a fresh interpreter with sockets disabled, so any network access or
+# heavy import during startup shows up
+startup_script = """
+import json, os, socket, sys, tempfile, time
+
+def refuse(*args):
+    raise OSError("network access during startup")
+
+socket.socket.connect = refuse
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+qt_app = app.QApplication([])
+window = app.MainWindow()
+shown = time.perf_counter()
+heavy = [name for name in sys.argv[1:] if name in sys.modules]
+
+from game_getter import GameGetter
+with tempfile.TemporaryDirectory() as directory:
+    getter_started = time.perf_counter()
+    getter = GameGetter(
+        cache_dir=os.path.join(directory, "page_cache"),
+        manifest_path=os.path.join(directory, "manifest.db"),
+    )
+    getter_s = time.perf_counter() - getter_started
+    getter.manifest.close()
+
+print(json.dumps({
+    "startup_ms": 1000 * (shown - started),
+    "import_app_ms": 1000 * (imported - started),
+    "main_window_ms": 1000 * (shown - imported),
+    "game_getter_init_ms": 1000 * getter_s,
+    "heavy_imports": heavy,
+}))
+"""
+
+# Nothing the window needs before a button is clicked
+heavy_modules = ["pandas", "numpy", "requests_html", "aiohttp", "pyarrow"]
+
+
+def benchmark_startup(repeat: int = 3) -> dict:
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", startup_script, *heavy_modules],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            return {"error": result.stderr.strip().splitlines()[-1]}
+
+        summary = json.loads(result.stdout.strip().splitlines()[-1])
+        if best is None or summary["startup_ms"] < best["startup_ms"]:
+            best = summary
+    return best
+
+
+def benchmark_memory(seasons: int | None = None) -> dict:
+    # Memory each frame takes as plain read_csv output, as the pipeline used
+    # to hold it, against the compact dtypes it is held in now
+    def report(before, after):
+        return {
+            "rows": len(after),
+            "before_mb": memory_mb(before),
+            "after_mb": memory_mb(after),
+            "ratio": memory_mb(after) / memory_mb(before),
+        }
+
+    players = pd.concat(
+        [
+            pd.DataFrame.from_dict(
+                parse_stats(path.as_uri(), path.read_text(encoding="utf-8"))[1],
+                orient="index",
+            )
+            for path in sorted(fixtures_dir.glob("boxscore_*.html"))
+        ]
+    )
+    summary = {"player_stats": report(players, compact_frame(players, player_schema))}
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            os.chdir(directory)
+            synthetic_team_stats(seasons).to_csv("team_stats.csv")
+            transformers.perform_all_transformations()
+
+            raw = pd.read_csv("team_stats.csv")
+            summary["team_stats"] = report(raw, compact_frame(raw, team_schema))
+            for name in transformers.stages:
+                before = pd.read_csv(transformers.stage_path(name, "csv"), index_col=0)
+                after = transformers.read_stage(name, index_col=0)
+                summary[name] = report(before, after)
+        finally:
+            os.chdir(cwd)
+
+    return summary
+
+
+def timings(summary: dict, prefix: str = "") -> dict:
+    # Flattens every *_ms / *_s entry into "section.key" -> seconds
+    flat = {}
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            flat.update(timings(value, f"{prefix}{key}."))
+        elif key.endswith("_ms"):
+            flat[f"{prefix}{key}"] = value / 1000
+        elif key.endswith("_s"):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def regressions(summary: dict, baseline: dict) -> list[dict]:
+    current = timings(summary)
+    return [
+        {"timing": key, "baseline_s": baseline_s, "current_s": current[key]}
+        for key, baseline_s in timings(baseline).items()
+        if key in current and current[key] > baseline_s * (1 + regression_tolerance)
+    ]
+
+
+def run(seasons: int | None = None, store: str = "csv") -> dict:
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "parse": benchmark_parse(),
+        "transform": benchmark_transform(seasons, store),
+        "memory": benchmark_memory(seasons),
+        "requests": benchmark_requests(),
+        "resume": benchmark_resume(),
+        "startup": benchmark_startup(),
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "record":
+        print(record_fixture(sys.argv[2], sys.argv[3]))
+        sys.exit(0)
+
+    summary = run()
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as file:
+            summary["regressions"] = regressions(summary, json.load(file))
+
+    print(json.dumps(summary, indent=2))
+    failed = (
+        summary.get("regressions")
+        or not summary["parse"]["parsers_agree"]
+        or summary["requests"]["lost"]
+        or summary["requests"]["aborted_in_flight"]
+        or summary["resume"]["unsaved_after_retry"]
+        or summary["resume"]["saved_rows"] != summary["resume"]["games"]
+        or "error" in summary["startup"]
+        or summary["startup"]["heavy_imports"]
+    )
+    sys.exit(1 if failed else 0)
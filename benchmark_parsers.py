@@ -0,0 +1,75 @@
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+
+from game_getter import parse_stats
+
+parsers = ["requests_html", "lxml"]
+
+
+def is_boxscore(html: str) -> bool:
+    return 'id="divBox_team"' in html
+
+
+def read_pages(directory: str) -> dict[str, str]:
+    # Accepts either a page cache directory or a folder of boxscore_*.html
+    # fixtures. Cached schedule pages are skipped, as they aren't box scores
+    pages = {}
+    for path in sorted(Path(directory).rglob("*.html.gz")):
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            html = file.read()
+        if is_boxscore(html):
+            pages[str(path)] = html
+    for path in sorted(Path(directory).rglob("boxscore_*.html")):
+        pages[str(path)] = path.read_text(encoding="utf-8")
+    return pages
+
+
+def compare_parsers(pages: dict[str, str], repeat: int = 3) -> dict:
+    timings = {parser: [] for parser in parsers}
+    mismatches = []
+    errors = []
+
+    for name, html in pages.items():
+        results = {}
+        for parser in parsers:
+            try:
+                best = float("inf")
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    results[parser] = parse_stats(name, html, parser)
+                    best = min(best, time.perf_counter() - started)
+                timings[parser].append(best)
+            except Exception as error:
+                results[parser] = error
+
+        if any(isinstance(result, Exception) for result in results.values()):
+            errors.append(
+                {parser: repr(result) for parser, result in results.items()}
+                | {"page": name}
+            )
+        elif results["requests_html"] != results["lxml"]:
+            mismatches.append(name)
+
+    summary = {"pages": len(pages), "mismatches": mismatches, "errors": errors}
+    for parser, times in timings.items():
+        if times:
+            summary[parser] = {
+                "total_s": sum(times),
+                "mean_ms": 1000 * sum(times) / len(times),
+                "max_ms": 1000 * max(times),
+            }
+
+    if timings["lxml"] and sum(timings["lxml"]) > 0:
+        summary["speedup"] = sum(timings["requests_html"]) / sum(timings["lxml"])
+
+    return summary
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else "page_cache"
+    summary = compare_parsers(read_pages(directory))
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary["mismatches"] or summary["errors"] else 0)
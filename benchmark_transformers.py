@@ -0,0 +1,689 @@
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import transformers
+from game_store import GameStore
+from utils import to_seconds, unknown_to_null
+
+# Every team name in use since 1978, with the seasons it was used
+franchises = [
+    ("Arizona Cardinals", 1994, None),
+    ("Atlanta Falcons", 1978, None),
+    ("Baltimore Colts", 1978, 1983),
+    ("Baltimore Ravens", 1996, None),
+    ("Buffalo Bills", 1978, None),
+    ("Carolina Panthers", 1995, None),
+    ("Chicago Bears", 1978, None),
+    ("Cincinnati Bengals", 1978, None),
+    ("Cleveland Browns", 1978, 1995),
+    ("Cleveland Browns", 1999, None),
+    ("Dallas Cowboys", 1978, None),
+    ("Denver Broncos", 1978, None),
+    ("Detroit Lions", 1978, None),
+    ("Green Bay Packers", 1978, None),
+    ("Houston Oilers", 1978, 1996),
+    ("Houston Texans", 2002, None),
+    ("Indianapolis Colts", 1984, None),
+    ("Jacksonville Jaguars", 1995, None),
+    ("Kansas City Chiefs", 1978, None),
+    ("Las Vegas Raiders", 2020, None),
+    ("Los Angeles Chargers", 2017, None),
+    ("Los Angeles Raiders", 1982, 1994),
+    ("Los Angeles Rams", 1978, 1994),
+    ("Los Angeles Rams", 2016, None),
+    ("Miami Dolphins", 1978, None),
+    ("Minnesota Vikings", 1978, None),
+    ("New England Patriots", 1978, None),
+    ("New Orleans Saints", 1978, None),
+    ("New York Giants", 1978, None),
+    ("New York Jets", 1978, None),
+    ("Oakland Raiders", 1978, 1981),
+    ("Oakland Raiders", 1995, 2019),
+    ("Philadelphia Eagles", 1978, None),
+    ("Phoenix Cardinals", 1988, 1993),
+    ("Pittsburgh Steelers", 1978, None),
+    ("San Diego Chargers", 1978, 2016),
+    ("San Francisco 49ers", 1978, None),
+    ("Seattle Seahawks", 1978, None),
+    ("St. Louis Cardinals", 1978, 1987),
+    ("St. Louis Rams", 1995, 2015),
+    ("Tampa Bay Buccaneers", 1978, None),
+    ("Tennessee Oilers", 1997, 1998),
+    ("Tennessee Titans", 1999, None),
+    ("Washington Commanders", 2022, None),
+    ("Washington Football Team", 2020, 2021),
+    ("Washington Redskins", 1978, 2019),
+]
+
+
+def season_teams(season: int) -> list[str]:
+    return [
+        team
+        for team, first, last in franchises
+        if first <= season and (last is None or season <= last)
+    ]
+
+
+def season_games(season: int) -> int:
+    # Regular season games per team, including the strike-shortened seasons
+    return {1982: 9, 1987: 15}.get(season, 17 if season >= 2021 else 16)
+
+
+def playoff_rounds(season: int) -> list[int]:
+    # Games in each round, from the wild card round to the Super Bowl
+    if season == 1982:
+        return [8, 4, 2, 1]
+    if season < 1990:
+        return [2, 4, 2, 1]
+    if season < 2020:
+        return [4, 4, 2, 1]
+    return [6, 4, 2, 1]
+
+
+def current_season() -> int:
+    today = date.today()
+    return today.year - 1 if today.month < 6 else today.year
+
+
+def synthetic_team_stats(seasons: int | None = None, seed: int = 0):
+    # Produces a frame shaped like a scraped team_stats.csv from 1978 onwards,
+    # following the league's teams, schedule lengths and playoff formats, with
+    # a few ties, overtime games and missing attendance
+    rng = np.random.default_rng(seed)
+    if seasons is None:
+        # Every completed season
+        seasons = current_season() - 1978
+    games = []
+
+    for season in range(1978, 1978 + seasons):
+        teams = np.array(season_teams(season))
+        kickoff = date(season, 9, 7)
+        weeks = season_games(season)
+        for week in range(weeks):
+            # With an odd number of teams one of them has the week off
+            playing = rng.permutation(len(teams))[: len(teams) // 2 * 2]
+            day = kickoff + timedelta(weeks=week)
+            for away, home in playing.reshape(-1, 2):
+                games.append((teams[away], teams[home], day, 0))
+        postseason_start = kickoff + timedelta(weeks=weeks + 1)
+        for round_, round_games in enumerate(playoff_rounds(season)):
+            day = postseason_start + timedelta(weeks=round_)
+            for _ in range(round_games):
+                away, home = rng.choice(len(teams), 2, replace=False)
+                games.append((teams[away], teams[home], day, round_ + 1))
+
+    n = len(games)
+
+    def ints(low, high):
+        return rng.integers(low, high, n)
+
+    def stat(*parts):
+        return ["-".join(str(part) for part in values) for values in zip(*parts)]
+
+    df = pd.DataFrame(
+        {
+            "postseason": [game[3] for game in games],
+            "away_team": [game[0] for game in games],
+            "home_team": [game[1] for game in games],
+            "date": [f"{game[2]:%B} {game[2].day}, {game[2].year}" for game in games],
+            "stadium": [f"{game[1]} Stadium" for game in games],
+        }
+    )
+
+    attendance = ints(30000, 90000).astype(str).astype(object)
+    attendance[rng.random(n) < 0.05] = "unknown"
+    df["attendance"] = attendance
+
+    overtime = rng.random(n) < 0.06
+    df["overtime"] = np.where(overtime, "true", "false")
+
+    quarters = {side: [ints(0, 15) for _ in range(5)] for side in ["away", "home"]}
+    for side in ["away", "home"]:
+        quarters[side][4] = np.where(overtime, quarters[side][4] % 7, 0)
+    # Force a handful of ties
+    tie = rng.random(n) < 0.004
+    for i in range(5):
+        quarters["home"][i] = np.where(tie, quarters["away"][i], quarters["home"][i])
+
+    df["away_score"] = sum(quarters["away"])
+    df["home_score"] = sum(quarters["home"])
+    for i in range(5):
+        df[f"away_score_q{i + 1}"] = quarters["away"][i]
+        df[f"home_score_q{i + 1}"] = quarters["home"][i]
+
+    stats = {}
+    for side in ["away", "home"]:
+        pass_att, rush_plays = ints(15, 55), ints(15, 45)
+        stats[side] = {
+            "first_downs": ints(8, 30),
+            "rushing": ints(2, 14),
+            "passing": ints(4, 18),
+            "penalty": ints(0, 5),
+            "third_downs": [
+                f"{made}-{att}-{round(100 * made / att)}%"
+                for made, att in zip(ints(0, 6), ints(6, 18))
+            ],
+            "fourth_downs": [
+                f"{made}-{att}-{round(100 * made / att)}%"
+                for made, att in zip(ints(0, 2), ints(2, 6))
+            ],
+            "total_net_yards": ints(150, 550),
+            "net_yards_rushing": ints(30, 250),
+            "rushing_plays": rush_plays,
+            "average_gain": np.round(rng.uniform(2, 6, n), 1),
+            "net_yards_passing": ints(80, 400),
+            "att-comp-int": stat(pass_att, pass_att // 2 + ints(0, 8), ints(0, 4)),
+            "sacked-yds_lost": stat(ints(0, 6), ints(0, 45)),
+            "gross_yards_passing": ints(90, 430),
+            "avg_yds/att": np.round(rng.uniform(4, 9, n), 1),
+            "punts-average": stat(ints(1, 9), np.round(rng.uniform(35, 50, n), 1)),
+            "had_blocked": ints(0, 2),
+            "punt_returns": stat(ints(0, 5), ints(0, 60)),
+            "kickoff_returns": stat(ints(1, 7), ints(20, 160)),
+            "interception_returns": [
+                f"{count}-{yards}" if count else "0--"
+                for count, yards in zip(ints(0, 3), ints(0, 60))
+            ],
+            "penalties-yards": stat(ints(2, 12), ints(15, 110)),
+            "fumbles-lost": stat(ints(0, 4), ints(0, 2)),
+            "field_goals": stat(ints(0, 4), ints(4, 6)),
+            "time_of_possession": [
+                f"{minutes}:{seconds:02d}"
+                for minutes, seconds in zip(ints(24, 36), ints(0, 60))
+            ],
+        }
+
+    # The scraper alternates away and home columns for every stat
+    for name in stats["away"]:
+        df[f"away_{name}"] = stats["away"][name]
+        df[f"home_{name}"] = stats["home"][name]
+
+    return df
+
+
+# Stats footballdb lists for each box score section, with the highest value
+# one player puts up in a game
+player_sections = {
+    "pass": {
+        "att": 55,
+        "cmp": 40,
+        "yds": 450,
+        "ypa": 12,
+        "td": 5,
+        "int": 4,
+        "lg": 80,
+        "sack": 7,
+        "loss": 50,
+        "rate": 158,
+    },
+    "kick_ret": {"num": 6, "yds": 180, "avg": 40, "lg": 100, "td": 1},
+    "rush": {"att": 30, "yds": 200, "avg": 8, "lg": 80, "td": 3, "fd": 12},
+    "rec": {"rec": 12, "yds": 200, "avg": 20, "lg": 80, "td": 3, "fd": 10},
+    "punt_ret": {"num": 6, "yds": 100, "avg": 20, "fc": 4, "lg": 90, "td": 1},
+    "punt": {"punts": 9, "yds": 450, "avg": 55, "lg": 70, "tb": 2, "in20": 5, "blk": 1},
+    "kick": {"xpa": 7, "xpm": 7, "fga": 5, "fgm": 5, "lg": 60, "pts": 20},
+    "def": {"tot": 15, "solo": 12, "ast": 8, "sck": 3, "int": 2, "pd": 4},
+}
+
+# The sections each roster spot shows up in: a quarterback, backs, receivers,
+# a kicker, a punter and defenders
+player_roles = [
+    ("pass", "rush"),
+    ("rush", "rec", "kick_ret"),
+    ("rush", "rec"),
+    ("rec", "punt_ret"),
+    ("rec",),
+    ("rec",),
+    ("rec",),
+    ("kick",),
+    ("punt",),
+] + [("def",)] * 13
+
+
+def synthetic_player_stats(team_stats, seed: int = 0):
+    # Produces a frame shaped like a scraped player_stats.csv for every game in
+    # team_stats, with the same roster names for a franchise every season
+    rng = np.random.default_rng(seed)
+    roles = len(player_roles)
+
+    # Away players, then home players, for each game in turn
+    teams = np.column_stack([team_stats["away_team"], team_stats["home_team"]])
+    team = np.repeat(teams.ravel(), roles)
+    date = np.repeat(np.repeat(team_stats["date"].to_numpy(), 2), roles)
+    spot = np.tile(np.arange(roles), 2 * len(team_stats))
+    n = len(team)
+
+    df = pd.DataFrame(
+        {
+            "player": pd.Series(team).astype(str) + " #" + pd.Series(spot).astype(str),
+            "date": date,
+            "team": team,
+        }
+    )
+
+    for section, stats in player_sections.items():
+        plays = np.isin(
+            spot, [i for i, role in enumerate(player_roles) if section in role]
+        )
+        for stat, high in stats.items():
+            if stat in ("avg", "ypa", "rate"):
+                values = np.round(rng.uniform(0, high, n), 1)
+            else:
+                values = rng.integers(0, high + 1, n).astype(float)
+            values[~plays] = np.nan
+
+            column = pd.Series(values)
+            if stat == "lg":
+                # A touchdown long carries a trailing "t"
+                text = column.astype("Int64").astype(str).where(column.notna(), "")
+                touchdown = plays & (rng.random(n) < 0.1)
+                column = text.where(~touchdown, text + "t")
+            df[f"{section}_{stat}"] = column
+
+    return df
+
+
+def loop_player_aggregates(df, recent_games: int):
+    # The same aggregates, one player and one game at a time
+    total_cols = [
+        col
+        for col in transformers.player_stat_columns(df.columns)
+        if not col.endswith(transformers.player_rate_suffixes)
+    ]
+    rows = {}
+
+    for _, games in df.groupby(["player", "team"], sort=False, observed=True):
+        history = []
+        for index, game in games.iterrows():
+            season_games = [
+                past for past in history if past["season"] == game["season"]
+            ]
+            recent = history[-recent_games:]
+            row = {"season_games": len(season_games)}
+            for col in total_cols:
+                row[f"season_{col}"] = sum(
+                    0 if pd.isna(past[col]) else past[col] for past in season_games
+                )
+                row[f"last{recent_games}_{col}"] = (
+                    sum(0 if pd.isna(past[col]) else past[col] for past in recent)
+                    / len(recent)
+                    if recent
+                    else np.nan
+                )
+            rows[index] = row
+            history.append(game)
+
+    return pd.DataFrame.from_dict(rows, orient="index").sort_index()
+
+
+def legacy_expand_frame(df):
+    # Column-by-column implementation that expand_frame replaced, kept for
+    # parity
+    dash_cols = transformers.columns_with_dashes
+    df[dash_cols] = df[dash_cols].replace("--", "-", regex=True)
+
+    for col in transformers.expanded_cols:
+        df[transformers.expanded_cols[col]] = df[col].str.split("-", expand=True)
+        df = df.drop(col, axis=1)
+
+    for col in ["away_time_of_possession", "home_time_of_possession"]:
+        df[col] = df[col].apply(to_seconds)
+
+    df = df.rename(columns=transformers.expanded_renames)
+
+    percent_cols = transformers.percent_columns
+    df[percent_cols] = df[percent_cols].replace("%", "", regex=True).astype(float) / 100
+    null_cols = transformers.columns_with_possible_nulls
+    df[null_cols] = df[null_cols].apply(pd.to_numeric, errors="coerce").fillna(0)
+
+    return df
+
+
+def legacy_split_frame(df):
+    # Row-by-row implementation that split_frame replaced, kept for parity
+    split_objs = []
+
+    for _, row in df.iterrows():
+        if row["away_score"] > row["home_score"]:
+            outcome = 1
+        elif row["away_score"] < row["home_score"]:
+            outcome = 0
+        else:
+            outcome = 0.5
+
+        base_obj = {
+            col: row[col]
+            for col in df.columns
+            if "away" not in col and "home" not in col
+        }
+
+        away_team_obj = {
+            **base_obj,
+            "outcome": outcome,
+            "home_or_away": 1,
+            "team": row["away_team"],
+            "opponent": row["home_team"],
+            "game_index": row["index"],
+            **{
+                col.replace("away", "team"): row[col]
+                for col in df.columns
+                if "away" in col
+            },
+            **{
+                col.replace("home", "opp"): row[col]
+                for col in df.columns
+                if "home" in col
+            },
+        }
+
+        home_team_obj = {
+            **base_obj,
+            "outcome": 1 - outcome,
+            "home_or_away": 0,
+            "team": row["home_team"],
+            "opponent": row["away_team"],
+            "game_index": row["index"],
+            **{
+                col.replace("home", "team"): row[col]
+                for col in df.columns
+                if "home" in col
+            },
+            **{
+                col.replace("away", "opp"): row[col]
+                for col in df.columns
+                if "away" in col
+            },
+        }
+
+        split_objs.extend([away_team_obj, home_team_obj])
+
+    split_df = pd.DataFrame(split_objs)
+    split_df["attendance"] = split_df["attendance"].apply(unknown_to_null)
+
+    return split_df
+
+
+def legacy_stagger_frame(df, team_dict):
+    # The nested-loop implementation that stagger_frame replaced, kept for
+    # parity. Rows are copied to dicts so the new keys are kept (updating a
+    # row Series silently drops them), and win % / streaks are computed from
+    # each team's original outcomes rather than ones already shifted forward.
+    separate_teams = {team: {} for team in team_dict}
+
+    for _, row in df.iterrows():
+        date = datetime.strptime(row["date"], "%B %d, %Y")
+        year = date.year - 1 if 1 <= date.month <= 6 else date.year
+        separate_teams[row["team"]].setdefault(year, []).append(row.to_dict())
+
+    outcomes = {
+        (team, year): [game["outcome"] for game in games]
+        for team, years in separate_teams.items()
+        for year, games in years.items()
+    }
+
+    def get_win_percentage(index, team, year):
+        if index == 0:
+            return None
+
+        wins = sum(outcomes[(team, year)][:index])
+        return wins / index
+
+    def get_win_streak(index, team, year):
+        if index == 0:
+            return 0
+
+        streak = 0
+        for outcome in outcomes[(team, year)][:index]:
+            if streak >= 1 and outcome == 0 or streak <= -1 and outcome == 1:
+                streak = -streak
+            elif outcome != 0.5:  # Assuming 0.5 is for ties
+                streak = (streak // abs(streak) if streak != 0 else 1) * outcome
+
+        return streak
+
+    separate_teams_list = []
+
+    for team, years in separate_teams.items():
+        for year, games in years.items():
+            for index, game in enumerate(games[:-1]):  # Skip the last game
+                next_game = games[index + 1]
+                opponent = next_game["opponent"]
+                game = {
+                    **game,
+                    "outcome": next_game["outcome"],
+                    "home_or_away": next_game["home_or_away"],
+                    "postseason": next_game["postseason"],
+                    "opponent": opponent,
+                    "date": next_game["date"],
+                    "stadium": next_game["stadium"],
+                }
+                prev_columns = transformers.prev_columns(game)
+                game = {
+                    f"prev_{col}" if col in prev_columns else col: value
+                    for col, value in game.items()
+                }
+                game.update(
+                    {
+                        "current_team": team_dict[team],
+                        "opp_current_team": team_dict[opponent],
+                        "team_win_pct": get_win_percentage(index, team, year),
+                        "opp_win_pct": get_win_percentage(index, opponent, year),
+                        "team_win_streak": get_win_streak(index, team, year),
+                        "opp_win_streak": get_win_streak(index, opponent, year),
+                    }
+                )
+                separate_teams_list.append(game)
+
+    separate_df = pd.DataFrame(separate_teams_list)
+
+    cols = [col for col in separate_df.columns if col != "prev_game_index"]
+    return separate_df[cols + ["prev_game_index"]]
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def benchmark_expand(directory: str) -> dict:
+    raw = transformers.read_team_stats()
+
+    legacy, legacy_s = timed(legacy_expand_frame, raw.copy())
+    vectorized, vectorized_s = timed(transformers.expand_frame, raw.copy())
+
+    # The stage is written with its schema applied, so compare what's written
+    legacy = transformers.apply_schema(legacy, "expanded_team_stats")
+    vectorized = transformers.apply_schema(vectorized, "expanded_team_stats")
+
+    return {
+        "games": len(raw),
+        "legacy_s": legacy_s,
+        "vectorized_s": vectorized_s,
+        "speedup": legacy_s / vectorized_s,
+        "identical": legacy.to_csv() == vectorized.to_csv(),
+    }
+
+
+def benchmark_split(directory: str) -> dict:
+    expanded = pd.read_csv(os.path.join(directory, "expanded_team_stats.csv"))
+    expanded = expanded.reset_index()
+
+    legacy, legacy_s = timed(legacy_split_frame, expanded)
+    vectorized, vectorized_s = timed(transformers.split_frame, expanded)
+
+    return {
+        "games": len(expanded),
+        "legacy_s": legacy_s,
+        "vectorized_s": vectorized_s,
+        "speedup": legacy_s / vectorized_s,
+        "identical": legacy.to_csv() == vectorized.to_csv(),
+    }
+
+
+def benchmark_stagger(directory: str) -> dict:
+    split = pd.read_csv(
+        os.path.join(directory, "expanded_split_team_stats.csv"), index_col=0
+    )
+    team_dict = transformers.get_teams()
+
+    legacy, legacy_s = timed(legacy_stagger_frame, split, team_dict)
+    vectorized, vectorized_s = timed(transformers.stagger_frame, split, team_dict)
+
+    return {
+        "rows": len(split),
+        "legacy_s": legacy_s,
+        "vectorized_s": vectorized_s,
+        "speedup": legacy_s / vectorized_s,
+        # The old streak could come out as -0.0, so compare values, not text
+        "equal": legacy.equals(vectorized),
+    }
+
+
+def grouped_form_features(df, windows, spans):
+    # One grouped rolling or ewm call per window, for reference
+    stats = df[transformers.form_columns(df.columns)]
+    season = transformers.get_seasons(df["date"])
+    grouped = stats.groupby([df["team"], season], sort=False, observed=True)
+    features = [
+        grouped.rolling(n, min_periods=1).mean().add_prefix(f"last{n}_")
+        for n in windows
+    ] + [grouped.ewm(span=span).mean().add_prefix(f"ewm{span}_") for span in spans]
+    return pd.concat(features, axis=1).droplevel([0, 1]).sort_index()
+
+
+def benchmark_form(directory: str, windows=(2, 3, 4, 6, 8, 12), spans=(2, 4, 8)):
+    split = transformers.read_stage("expanded_split_team_stats", index_col=0)
+    team_dict = transformers.get_teams()
+
+    _, plain_s = timed(transformers.stagger_frame, split, team_dict)
+    _, single_s = timed(transformers.stagger_frame, split, team_dict, [3], [4])
+    staggered, all_s = timed(
+        transformers.stagger_frame, split, team_dict, windows, spans
+    )
+    grouped, grouped_s = timed(grouped_form_features, split, windows, spans)
+
+    # A staggered row carries the features of the game it was staggered from
+    grouped.index = pd.MultiIndex.from_arrays([split["team"], split["game_index"]])
+    played = pd.MultiIndex.from_arrays(
+        [staggered["team"], staggered["prev_game_index"]]
+    )
+    features = staggered[grouped.columns]
+
+    return {
+        "rows": len(staggered),
+        "features": len(grouped.columns),
+        "no_features_s": plain_s,
+        "one_window_and_span_s": single_s,
+        "all_windows_and_spans_s": all_s,
+        "grouped_s": grouped_s,
+        "speedup": grouped_s / (all_s - plain_s),
+        "equal": np.allclose(
+            features.to_numpy(dtype=float),
+            grouped.loc[played].to_numpy(dtype=float),
+            equal_nan=True,
+        ),
+    }
+
+
+def benchmark_queries(directory: str) -> dict:
+    # Each lookup answered from games.db, against loading the split stage and
+    # filtering it in pandas
+    def from_csv(team, opponent, since):
+        df = pd.read_csv(os.path.join(directory, "expanded_split_team_stats.csv"))
+        season = transformers.get_seasons(df["date"])
+        return df[
+            (df["team"] == team) & (df["opponent"] == opponent) & (season >= since)
+        ]
+
+    games = GameStore(os.path.join(directory, "games.db"))
+    try:
+        lookups = {
+            "team_season": (games.team_games, ("Green Bay Packers", 2010)),
+            "head_to_head": (
+                games.head_to_head,
+                ("Green Bay Packers", "Chicago Bears", 2000),
+            ),
+            "week": (games.week_games, (2010, 3)),
+        }
+        results = {
+            name: timed(lookup, *args)[1] * 1000
+            for name, (lookup, args) in lookups.items()
+        }
+        _, csv_s = timed(from_csv, "Green Bay Packers", "Chicago Bears", 2000)
+    finally:
+        games.close()
+
+    return {
+        **{f"{name}_ms": ms for name, ms in results.items()},
+        "csv_filter_ms": csv_s * 1000,
+    }
+
+
+def benchmark_players(directory: str, sample_rows: int = 2000) -> dict:
+    normalized = transformers.read_stage("normalized_player_stats", index_col=0)
+    recent_games = transformers.player_recent_games
+
+    aggregated, vectorized_s = timed(
+        transformers.aggregate_player_frame, normalized, recent_games
+    )
+
+    # The loop takes far too long for the full history, so check it on the
+    # leading rows; aggregates only look back, so a cut-off player still matches
+    sample = normalized.iloc[:sample_rows]
+    loop, loop_s = timed(loop_player_aggregates, sample, recent_games)
+    sample_vectorized, sample_s = timed(
+        transformers.aggregate_player_frame, sample, recent_games
+    )
+
+    return {
+        "rows": len(aggregated),
+        "vectorized_s": vectorized_s,
+        "sample_rows": len(sample),
+        "sample_loop_s": loop_s,
+        "sample_vectorized_s": sample_s,
+        "speedup": loop_s / sample_s,
+        "equal": np.allclose(
+            sample_vectorized[loop.columns].to_numpy(dtype=float),
+            loop.to_numpy(dtype=float),
+            equal_nan=True,
+        ),
+    }
+
+
+def run(seasons: int | None = None) -> dict:
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        team_stats = synthetic_team_stats(seasons)
+        team_stats.to_csv(os.path.join(directory, "team_stats.csv"))
+        synthetic_player_stats(team_stats).to_csv(
+            os.path.join(directory, "player_stats.csv")
+        )
+        try:
+            # The transformers read and write relative to the working directory
+            os.chdir(directory)
+            transformers.expand_team_stats()
+            transformers.split_team_stats()
+            transformers.normalize_player_stats()
+            return {
+                "expand": benchmark_expand(directory),
+                "split": benchmark_split(directory),
+                "stagger": benchmark_stagger(directory),
+                "form": benchmark_form(directory),
+                "queries": benchmark_queries(directory),
+                "players": benchmark_players(directory),
+            }
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    seasons = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    print(json.dumps(run(seasons), indent=2))
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+# Text the scraper writes for a value footballdb doesn't have
+missing_values = ["", "unknown"]
+
+# Dtypes the scraped frames are held in from parsing onwards. Repeated text
+# becomes categorical, overtime becomes boolean and every numeric column is
+# narrowed to the smallest int, or float32, that holds it
+team_schema = {
+    "category": ["away_team", "home_team", "date", "stadium"],
+    "bool": ["overtime"],
+}
+
+player_schema = {
+    "category": ["player", "team", "date"],
+    "bool": [],
+}
+
+
+def to_bool(values: pd.Series) -> pd.Series:
+    # The scraper writes "true" / "false", which astype(bool) would read as True
+    if pd.api.types.is_bool_dtype(values):
+        return values
+    return values.astype(str).str.lower().isin(["true", "1", "1.0"])
+
+
+def to_compact_numeric(values: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(values):
+        return values
+    if not pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values.replace(missing_values, np.nan))
+    if pd.api.types.is_integer_dtype(values):
+        return pd.to_numeric(values, downcast="integer")
+    return values.astype("float32")
+
+
+def compact_column(values: pd.Series, schema: dict, strict: bool) -> pd.Series:
+    if values.name in schema["category"]:
+        return values.astype("category")
+    if values.name in schema["bool"]:
+        return to_bool(values)
+
+    try:
+        return to_compact_numeric(values)
+    except (TypeError, ValueError) as error:
+        if strict:
+            raise ValueError(
+                f"Column {values.name!r} should be numeric ({error})"
+            ) from error
+        return values
+
+
+def compact_frame(df: pd.DataFrame, schema: dict, strict: bool = False) -> pd.DataFrame:
+    # With strict, every column outside the schema must be numeric; otherwise
+    # text that isn't a number, such as "30-20-1", is left as it is
+    return pd.DataFrame(
+        {col: compact_column(df[col], schema, strict) for col in df.columns},
+        index=df.index,
+    )
+
+
+def memory_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 1024**2
@@ -0,0 +1,161 @@
+import re
+
+import lxml.html
+
+# Mirrors pyquery's text extraction, which requests_html uses for `.text`, so
+# both parser backends split pages into exactly the same lines
+INLINE_TAGS = {
+    "a",
+    "abbr",
+    "acronym",
+    "b",
+    "bdo",
+    "big",
+    "br",
+    "button",
+    "cite",
+    "code",
+    "dfn",
+    "em",
+    "i",
+    "img",
+    "input",
+    "kbd",
+    "label",
+    "map",
+    "object",
+    "q",
+    "samp",
+    "script",
+    "select",
+    "small",
+    "span",
+    "strong",
+    "sub",
+    "sup",
+    "textarea",
+    "time",
+    "tt",
+    "var",
+}
+
+html_whitespace = re.compile("[\x20\x09\x0c\u200b\x0a\x0d]+")
+
+# Markers for block boundaries and <br> separators in the flattened text
+BLOCK = None
+SEPARATOR = True
+
+
+def flatten_text(element) -> list:
+    parts = []
+    # Walk the subtree iteratively, emitting closing markers and tails on exit
+    stack = [(element, False)]
+
+    while stack:
+        node, closing = stack.pop()
+
+        if closing:
+            if node.tag not in INLINE_TAGS:
+                parts.append(BLOCK)
+            if node is not element and node.tail is not None:
+                parts.append(node.tail)
+            continue
+
+        if not isinstance(node.tag, str):
+            # Comments and processing instructions only contribute their tail
+            if node is not element and node.tail is not None:
+                parts.append(node.tail)
+            continue
+
+        if node.tag == "br":
+            parts.append(SEPARATOR)
+        elif node.tag not in INLINE_TAGS:
+            parts.append(BLOCK)
+
+        if node.text is not None:
+            parts.append(node.text)
+
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(node))
+
+    return parts
+
+
+def element_text(element) -> str:
+    parts = []
+    buffer = []
+
+    def flush():
+        if buffer:
+            item = html_whitespace.sub(" ", "".join(buffer)).strip()
+            if item:
+                parts.append(item)
+            buffer.clear()
+
+    for part in flatten_text(element):
+        if isinstance(part, str):
+            buffer.append(part)
+            continue
+
+        flush()
+        # Consecutive block boundaries collapse into a single newline
+        if part is BLOCK and parts and parts[-1] is BLOCK:
+            continue
+        parts.append(part)
+    flush()
+
+    return "".join(
+        "\n" if part is BLOCK or part is SEPARATOR else part for part in parts
+    ).strip()
+
+
+def has_class(element, class_name: str) -> bool:
+    return class_name in element.get("class", "").split()
+
+
+def find_sections(html: str) -> dict:
+    try:
+        root = lxml.html.document_fromstring(html)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        root = lxml.html.document_fromstring(html.encode("utf-8"))
+
+    sections = {"center": [], "statistics": None, "team": None, "stats": None}
+
+    # One walk over the document finds every element the parsers need
+    for element in root.iter():
+        if not isinstance(element.tag, str):
+            continue
+
+        if element.tag == "center":
+            sections["center"].append(element)
+
+        if sections["statistics"] is None and has_class(element, "statistics"):
+            sections["statistics"] = element
+
+        element_id = element.get("id")
+        if element_id == "divBox_team" and sections["team"] is None:
+            sections["team"] = element
+        elif element_id == "divBox_stats" and sections["stats"] is None:
+            sections["stats"] = element
+
+    return sections
+
+
+def extract_game(html: str) -> tuple[list[str], list[str], list[list[str]], list[str]]:
+    sections = find_sections(html)
+
+    game_info = element_text(sections["center"][1]).split("\n")
+    score_line = element_text(sections["statistics"]).split("\n")
+
+    team_stats_rows = []
+    for section in sections["team"].iter("tbody"):
+        for row in section.iter("tr"):
+            stats = list(row.iter("td"))
+            team_stats_rows.append(
+                [element_text(stats[0]), element_text(stats[1]), element_text(stats[2])]
+            )
+
+    player_stats = element_text(sections["stats"]).split("\n")
+
+    return game_info, score_line, team_stats_rows, player_stats
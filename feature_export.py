@@ -0,0 +1,98 @@
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from stage_store import read_stage, stage_path
+
+target = "outcome"
+
+# Row labels of earlier stages that CSV stores carry along as columns
+index_pattern = re.compile(r"^(Unnamed: \d+(\.\d+)?|index|level_\d+)$")
+
+files = {"features": "features.npy", "target": "outcome.npy", "index": "index.npy"}
+
+
+def feature_columns(columns: list[str]) -> list[str]:
+    return [col for col in columns if col != target and not index_pattern.match(col)]
+
+
+def write_array(path: Path, shape: tuple, dtype, fill) -> None:
+    # Written through a memory map, and only named once it's complete
+    partial = path.with_name(f".{path.name}.tmp")
+    array = np.lib.format.open_memmap(partial, mode="w+", dtype=dtype, shape=shape)
+    fill(array)
+    array.flush()
+    del array
+    partial.replace(path)
+
+
+def export_features(store: str = "csv", directory: str = "features") -> dict:
+    # Writes the preprocessed stage as a C-ordered float32 matrix with a
+    # column per feature, the outcome and each row's stage label as .npy
+    # files, plus a manifest naming the columns. Categorical columns become
+    # their category codes, missing values NaN
+    df = read_stage("preprocessed_team_stats", store, index_col=0)
+    columns = feature_columns(list(df.columns))
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    categories = {}
+
+    def fill_features(array):
+        for i, col in enumerate(columns):
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories[col] = values.cat.categories.astype(str).tolist()
+                codes = values.cat.codes.to_numpy()
+                array[:, i] = np.where(codes < 0, np.nan, codes)
+            else:
+                array[:, i] = values.to_numpy(dtype="float32", na_value=np.nan)
+
+    write_array(
+        directory / files["features"], (len(df), len(columns)), "float32", fill_features
+    )
+
+    def fill_target(array):
+        array[:] = df[target].to_numpy(dtype="float32", na_value=np.nan)
+
+    def fill_index(array):
+        array[:] = df.index.to_numpy()
+
+    write_array(directory / files["target"], (len(df),), "float32", fill_target)
+    write_array(directory / files["index"], (len(df),), "int64", fill_index)
+    metrics.rows("features", len(df))
+
+    manifest = {
+        "source": str(stage_path("preprocessed_team_stats", store)),
+        "rows": len(df),
+        "dtype": "float32",
+        "files": files,
+        "columns": columns,
+        "target": target,
+        "categories": categories,
+    }
+    # Readers go by the manifest, so it's replaced last
+    partial = directory / ".manifest.json.tmp"
+    partial.write_text(json.dumps(manifest, indent=2))
+    partial.replace(directory / "manifest.json")
+    return manifest
+
+
+def load_features(
+    directory: str = "features", mmap_mode: str | None = "r"
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+    # With mmap_mode, every process loading the export shares the same pages
+    # of the files instead of holding its own copy
+    directory = Path(directory)
+    manifest = json.loads((directory / "manifest.json").read_text())
+    features, target_values, index = (
+        np.load(directory / manifest["files"][name], mmap_mode=mmap_mode)
+        for name in ("features", "target", "index")
+    )
+    if features.shape != (manifest["rows"], len(manifest["columns"])):
+        raise ValueError(f"{directory}: features don't match the manifest")
+    return features, target_values, index, manifest
@@ -1,9 +1,32 @@
 from datetime import datetime
+import functools
+import hashlib
+import os
+import queue
+import threading
+import time
 import pandas as pd
-from requests_html import HTMLSession
+import requests
+from requests_html import HTML, HTMLSession
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from enum import Enum
+from async_fetcher import AsyncFetcher
+import fast_parser
+import jobs
+import metrics
+from compact import compact_frame, player_schema, team_schema
+from keyed_stats import KeyedStatsFile, player_game_ids, team_game_ids
+from manifest import DONE, FAILED, PARSED, ScrapeManifest
+from output_writer import PartitionedWriter
+from scheduler import SeasonScheduler
+from page_cache import PageCache, PageNotCached
+from throttle import RequestThrottle, parse_retry_after, retry_statuses
+
+BASE_URL = "https://www.footballdb.com"
+
+# Bump whenever parsing changes so reparse_stale picks up old games
+PARSE_VERSION = 1
 
 
 class GameType(Enum):
@@ -36,202 +59,555 @@ stat_section_mapping = {
 }
 
 
-class GameGetter:
-    def __init__(self):
-        self.session = HTMLSession()
-        self.last_played_week = self.get_last_played_week()
+def build_player_stats(player_stats: list[str], team_stats_obj: dict) -> dict:
+    player_stats_obj = {}
 
-    @property
-    def current_season() -> int:
-        today = datetime.today()
-        # If the current month is before June, subtract one year
-        return today.year - 1 if today.month < 6 else today.year
+    header_flag = False
+    stat_headers = []
+    player = ""
+    team = ""
 
-    def get_player_stats(self, res: HTMLSession, team_stats_obj: dict) -> list[dict]:
-        player_stats_obj = {}
+    for stat in player_stats:
+        if stat in stat_section_mapping:
+            stat_section = stat_section_mapping[stat]
 
-        player_stats = res.html.find("#divBox_stats", first=True).text.split("\n")
-        header_flag = False
-        stat_headers = []
-        player = ""
-        team = ""
-
-        for stat in player_stats:
-            if stat in stat_section_mapping:
-                stat_section = stat_section_mapping[stat]
-
-            elif (
-                team_stats_obj["away_team"] in stat
-                or team_stats_obj["home_team"] in stat
-            ):
-                team = "away" if team_stats_obj["away_team"] in stat else "home"
-                header_flag = True
-                stat_headers = []
-
-            elif ".\xa0" in stat:
-                header_flag = False
-                player = stat[: stat.index(".\xa0") - 1]
-                if player not in player_stats_obj:
-                    player_stats_obj[player] = {
-                        "date": team_stats_obj["date"],
-                        "team": team_stats_obj[f"{team}_team"],
-                    }
-                i = 0
-
-            elif stat == "TeamTeam" or stat == ".":
-                header_flag = False
-                player = ""
+        elif team_stats_obj["away_team"] in stat or team_stats_obj["home_team"] in stat:
+            team = "away" if team_stats_obj["away_team"] in stat else "home"
+            header_flag = True
+            stat_headers = []
+
+        elif ".\xa0" in stat:
+            header_flag = False
+            player = stat[: stat.index(".\xa0") - 1]
+            if player not in player_stats_obj:
+                player_stats_obj[player] = {
+                    "date": team_stats_obj["date"],
+                    "team": team_stats_obj[f"{team}_team"],
+                }
+            i = 0
+
+        elif stat == "TeamTeam" or stat == ".":
+            header_flag = False
+            player = ""
 
+        else:
+            if header_flag:
+                stat_headers.append(f"{stat_section}_{stat.lower()}")
             else:
-                if header_flag:
-                    stat_headers.append(f"{stat_section}_{stat.lower()}")
-                else:
-                    if player != "":
-                        player_stats_obj[player][stat_headers[i]] = stat
-                        i += 1
+                if player != "":
+                    player_stats_obj[player][stat_headers[i]] = stat
+                    i += 1
 
-        return player_stats_obj
+    return player_stats_obj
 
-    def get_team_stats(self, res: HTMLSession) -> dict:
-        team_stats_obj = {}
 
-        game_info = res.html.find("center")[1].text.split("\n")
+def build_team_stats(
+    game_info: list[str], score_line: list[str], team_stats_rows: list[list[str]]
+) -> dict:
+    team_stats_obj = {}
+
+    playoff_add = 0
+    team_stats_obj["postseason"] = GameType.REGULAR_SEASON.value
+
+    if any(x in game_info[0] for x in ["AFC", "NFC", "Super Bowl"]):
+        for key, value in label_to_game_type.items():
+            if key in game_info[0]:
+                team_stats_obj["postseason"] = value.value
+                playoff_add = 1
+                break
 
-        playoff_add = 0
-        team_stats_obj["postseason"] = GameType.REGULAR_SEASON.value
+    team_names = game_info[0 + playoff_add]
 
-        if any(x in game_info[0] for x in ["AFC", "NFC", "Super Bowl"]):
-            for key, value in label_to_game_type.items():
-                if key in game_info[0]:
-                    team_stats_obj["postseason"] = value
-                    playoff_add = 1
-                    break
+    team_stats_obj["away_team"] = team_names[: team_names.index(" vs ")]
+    team_stats_obj["home_team"] = team_names[(team_names.index(" vs ") + 4) :]
 
-        team_names = game_info[0 + playoff_add]
+    team_stats_obj["date"] = game_info[1 + playoff_add]
+    team_stats_obj["stadium"] = game_info[2 + playoff_add]
 
-        team_stats_obj["away_team"] = team_names[: team_names.index(" vs ")]
-        team_stats_obj["home_team"] = team_names[(team_names.index(" vs ") + 4) :]
+    attendance_index = next(
+        (i for i, info in enumerate(game_info) if "Attendance" in info), -1
+    )
+    if attendance_index != -1:
+        team_stats_obj["attendance"] = game_info[attendance_index][12:].replace(",", "")
+    else:
+        team_stats_obj["attendance"] = "unknown"
 
-        team_stats_obj["date"] = game_info[1 + playoff_add]
-        team_stats_obj["stadium"] = game_info[2 + playoff_add]
+    is_overtime = score_line[4] == "5"
+    team_stats_obj["overtime"] = "true" if is_overtime else "false"
 
-        attendance_index = next(
-            (i for i, info in enumerate(game_info) if "Attendance" in info), -1
+    score_offset = 7 if is_overtime else 6
+    team_stats_obj["away_score"] = score_line[score_offset + 5]
+    team_stats_obj["home_score"] = score_line[score_offset + 5 + 7]
+
+    for i in range(1, 6):
+        team_stats_obj[f"away_score_q{i}"] = (
+            score_line[score_offset + i - 1] if i <= 4 or is_overtime else "0"
+        )
+        team_stats_obj[f"home_score_q{i}"] = (
+            score_line[score_offset + i + 6 - 1] if i <= 4 or is_overtime else "0"
         )
-        if attendance_index != -1:
-            team_stats_obj["attendance"] = game_info[attendance_index][12:].replace(
-                ",", ""
-            )
-        else:
-            team_stats_obj["attendance"] = "unknown"
 
-        score_line = res.html.find(".statistics", first=True).text.split("\n")
+    for stat_name, away_stat, home_stat in team_stats_rows:
+        stat_name = (
+            stat_name.lower().replace(" ", "_").replace("_-_", "-").replace(".", "")
+        )
 
-        is_overtime = score_line[4] == "5"
-        team_stats_obj["overtime"] = "true" if is_overtime else "false"
+        team_stats_obj[f"away_{stat_name}"] = away_stat
+        team_stats_obj[f"home_{stat_name}"] = home_stat
 
-        score_offset = 7 if is_overtime else 6
-        team_stats_obj["away_score"] = score_line[score_offset + 5]
-        team_stats_obj["home_score"] = score_line[score_offset + 5 + 7]
+    return team_stats_obj
 
-        for i in range(1, 6):
-            team_stats_obj[f"away_score_q{i}"] = (
-                score_line[score_offset + i - 1] if i <= 4 or is_overtime else "0"
-            )
-            team_stats_obj[f"home_score_q{i}"] = (
-                score_line[score_offset + i + 6 - 1] if i <= 4 or is_overtime else "0"
-            )
 
+class Page:
+    # Stands in for an HTMLResponse when the markup was downloaded elsewhere
+    def __init__(self, html: str, url: str):
+        self.html = HTML(html=html, url=url)
+
+
+class GameGetter:
+    def __init__(
+        self,
+        engine: str = "thread",
+        base_url: str = BASE_URL,
+        max_connections_per_host: int = 8,
+        cache_dir: str | None = "page_cache",
+        cache_max_bytes: int = 1024**3,
+        offline: bool = False,
+        parser: str = "requests_html",
+        manifest_path: str = "manifest.db",
+        parse_workers: int | None = None,
+        max_pending_pages: int = 64,
+        requests_per_second: float = 4.0,
+        timeout: float = 30,
+        max_retries: int = 5,
+    ):
+        if engine not in ("thread", "async"):
+            raise ValueError(f"Unknown engine: {engine}")
+        if parser not in ("requests_html", "lxml"):
+            raise ValueError(f"Unknown parser: {parser}")
+
+        self.engine = engine
+        self.parser = parser
+        self.base_url = base_url
+        self.max_connections_per_host = max_connections_per_host
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.max_pending_pages = max_pending_pages
+        self.timeout = timeout
+        # Shared by both engines so every request to footballdb counts
+        # against the same budget
+        self.throttle = RequestThrottle(
+            rate=requests_per_second,
+            max_concurrency=max_connections_per_host,
+            max_retries=max_retries,
+        )
+        self.session = HTMLSession()
+
+        if offline and cache_dir is None:
+            raise ValueError("Offline mode requires a page cache")
+
+        self.cache = (
+            PageCache(cache_dir, max_bytes=cache_max_bytes, offline=offline)
+            if cache_dir is not None
+            else None
+        )
+        self.manifest = ScrapeManifest(manifest_path)
+
+    @functools.cached_property
+    def last_played_week(self) -> int:
+        # Needs the network, so only look it up once something asks for it
+        return self.get_last_played_week()
+
+    @property
+    def current_season(self) -> int:
+        today = datetime.today()
+        # If the current month is before June, subtract one year
+        return today.year - 1 if today.month < 6 else today.year
+
+    @staticmethod
+    def get_player_stats(res: HTMLSession, team_stats_obj: dict) -> list[dict]:
+        player_stats = res.html.find("#divBox_stats", first=True).text.split("\n")
+        return build_player_stats(player_stats, team_stats_obj)
+
+    @staticmethod
+    def get_team_stats(res: HTMLSession) -> dict:
+        game_info = res.html.find("center")[1].text.split("\n")
+        score_line = res.html.find(".statistics", first=True).text.split("\n")
+
+        team_stats_rows = []
         team_stats_sections = res.html.find("#divBox_team", first=True).find("tbody")
 
         for section in team_stats_sections:
             for row in section.find("tr"):
                 stats = row.find("td")
-                stat_name = stats[0].text
-
-                stat_name = (
-                    stat_name.lower()
-                    .replace(" ", "_")
-                    .replace("_-_", "-")
-                    .replace(".", "")
-                )
+                team_stats_rows.append([stats[0].text, stats[1].text, stats[2].text])
 
-                team_stats_obj[f"away_{stat_name}"] = stats[1].text
-                team_stats_obj[f"home_{stat_name}"] = stats[2].text
+        return build_team_stats(game_info, score_line, team_stats_rows)
 
-        return team_stats_obj
+    def parse_stats(self, url: str, html: str) -> tuple[dict, dict]:
+        return parse_stats(url, html, self.parser)
 
-    def get_game(self, session: HTMLSession, url: str) -> tuple[pd.DataFrame]:
-        res = session.get(url)
-
-        team_stats = self.get_team_stats(res)
-        player_stats = self.get_player_stats(res, team_stats)
+    def parse_page(self, url: str, html: str) -> tuple[pd.DataFrame]:
+        team_stats, player_stats = self.parse_stats(url, html)
 
         team_df = pd.DataFrame.from_dict([team_stats])
         player_df = pd.DataFrame.from_dict(player_stats, orient="index")
 
-        return team_df, player_df
+        return (
+            compact_frame(team_df, team_schema),
+            compact_frame(player_df, player_schema),
+        )
+
+    def download(self, url: str, session: HTMLSession = None) -> str:
+        session = session or self.session
+
+        for attempt in range(self.throttle.max_retries + 1):
+            jobs.check_cancelled()
+            self.throttle.wait()
+            started = time.perf_counter()
+            try:
+                res = session.get(url, timeout=self.timeout)
+            except Exception as error:
+                self.throttle.failed()
+                metrics.request(time.perf_counter() - started, error=error)
+                retryable = isinstance(
+                    error, (requests.ConnectionError, requests.Timeout)
+                )
+                if not retryable or attempt == self.throttle.max_retries:
+                    raise
+                metrics.count("retries", reason=type(error).__name__)
+                time.sleep(self.throttle.retry_delay(attempt))
+                continue
+            except BaseException:
+                self.throttle.release()
+                raise
+
+            metrics.request(
+                time.perf_counter() - started, res.status_code, len(res.content)
+            )
+            if res.status_code in retry_statuses:
+                retry_after = parse_retry_after(res.headers.get("Retry-After"))
+                self.throttle.failed(retry_after, throttled=res.status_code == 429)
+                if attempt == self.throttle.max_retries:
+                    res.raise_for_status()
+                metrics.count("retries", reason=res.status_code)
+                time.sleep(self.throttle.retry_delay(attempt, retry_after))
+                continue
+
+            self.throttle.succeeded(time.perf_counter() - started)
+            # Never let an error page reach the parsers or the page cache
+            res.raise_for_status()
+            return res.text
+
+    def fetch_page(self, url: str, cacheable: bool = True) -> str:
+        if self.cache is None:
+            return self.download(url)
+
+        return self.cache.get_or_fetch(url, self.download, cacheable)
+
+    def get_game(self, session: HTMLSession, url: str) -> tuple[pd.DataFrame]:
+        if self.cache is None:
+            html = self.download(url, session)
+        else:
+            html = self.cache.get_or_fetch(url, lambda url: self.download(url, session))
+        return self.parse_page(url, html)
 
     def process_game(self, game_url: str) -> tuple[pd.DataFrame]:
-        url = f"https://www.footballdb.com{game_url}"
-        return self.get_game(self.session, url, False)
+        url = f"{self.base_url}{game_url}"
+        return self.get_game(self.session, url)
+
+    def get_season_game_links(self, year: int, start_week: int = 1) -> dict[str, int]:
+        res = self.query_game_url(year)
+        game_links = parse_game_links(res, start_week)
+
+        metrics.count("game_links", len(game_links))
+
+        self.manifest.add_games(game_links, year)
+
+        return game_links
+
+    def record_game(self, game_url: str, html: str) -> tuple[dict, dict]:
+        team_stats, player_stats = self.parse_stats(f"{self.base_url}{game_url}", html)
+        self.manifest.mark_parsed(game_url, page_hash(html), PARSE_VERSION)
+        return team_stats, player_stats
+
+    def record_failure(self, game_url: str, error: Exception) -> None:
+        self.manifest.mark_failed(game_url, repr(error))
+        tqdm.write(f"Failed to scrape {game_url}: {error!r}")
+
+    def fetch_games_threaded(
+        self, game_links: list[str], handle_game, handle_failure=None
+    ) -> None:
+        # Threads only download; parsing runs in worker processes so it doesn't
+        # hold the GIL against the downloads. A page holds a slot from the
+        # moment its download starts until its stats are handled, so when
+        # parsing falls behind the downloads wait instead of piling up pages
+        slots = threading.Semaphore(self.max_pending_pages)
+        stopping = threading.Event()
+        results = queue.Queue()
+
+        def fetch(game_url):
+            slots.acquire()
+            if stopping.is_set():
+                return
+
+            try:
+                url = f"{self.base_url}{game_url}"
+                html = self.fetch_page(url)
+                content_hash = page_hash(html)
+                future = parsers.submit(measured_parse_stats, url, html, self.parser)
+            except (Exception, jobs.JobCancelled) as error:
+                results.put((game_url, None, error))
+                return
+
+            future.add_done_callback(
+                lambda future: results.put((game_url, content_hash, future))
+            )
+
+        # Forked workers would otherwise send back the parent's metrics too
+        parsers = ProcessPoolExecutor(self.parse_workers, initializer=metrics.reset)
+        # The throttle decides how many downloads actually run at once
+        fetchers = ThreadPoolExecutor(self.throttle.max_concurrency)
+        with parsers, fetchers:
+            for game_url in game_links:
+                fetchers.submit(fetch, game_url)
+
+            try:
+                for _ in range(len(game_links)):
+                    game_url, content_hash, outcome = results.get()
+                    slots.release()
+
+                    try:
+                        if isinstance(outcome, BaseException):
+                            raise outcome
+                        (team_stats, player_stats), recorded = outcome.result()
+                        metrics.merge(recorded)
+                    except Exception as error:
+                        self.record_failure(game_url, error)
+                        if handle_failure is not None:
+                            handle_failure(game_url)
+                        continue
+
+                    self.manifest.mark_parsed(game_url, content_hash, PARSE_VERSION)
+                    handle_game(game_url, team_stats, player_stats)
+            except BaseException:
+                # Let every waiting download through so the pools can shut down
+                stopping.set()
+                fetchers.shutdown(wait=False, cancel_futures=True)
+                parsers.shutdown(wait=False, cancel_futures=True)
+                slots.release(len(game_links))
+                raise
+
+    def fetch_games_async(
+        self, game_links: list[str], handle_game, handle_failure=None
+    ) -> None:
+        if self.cache is not None:
+            # Cached pages never touch the network, so parse them directly
+            cached_links = [
+                game_url
+                for game_url in game_links
+                if f"{self.base_url}{game_url}" in self.cache
+            ]
+            self.fetch_games_threaded(cached_links, handle_game, handle_failure)
+            cached_set = set(cached_links)
+            game_links = [
+                game_url for game_url in game_links if game_url not in cached_set
+            ]
+
+            if self.cache.offline:
+                # Same as the threaded engine: each miss fails only its game
+                for game_url in game_links:
+                    self.record_failure(
+                        game_url, PageNotCached(f"{self.base_url}{game_url}")
+                    )
+                    if handle_failure is not None:
+                        handle_failure(game_url)
+                return
+
+        # Games are handled from the fetcher's worker threads
+        lock = threading.Lock()
+
+        def handle_page(url, html):
+            if self.cache is not None:
+                self.cache.put(url, html)
+            game_url = url[len(self.base_url) :]
+            team_stats, player_stats = self.record_game(game_url, html)
+            with lock:
+                handle_game(game_url, team_stats, player_stats)
+
+        def handle_error(url, error):
+            game_url = url[len(self.base_url) :]
+            self.record_failure(game_url, error)
+            if handle_failure is not None:
+                with lock:
+                    handle_failure(game_url)
+
+        fetcher = AsyncFetcher(
+            max_connections_per_host=self.max_connections_per_host,
+            timeout=self.timeout,
+            throttle=self.throttle,
+        )
+        urls = [f"{self.base_url}{game_url}" for game_url in game_links]
+        fetcher.fetch_all(urls, handle_page, handle_error)
 
+    @metrics.run("get_games")
     def get_games(
-        self, start_year: int, last_year_start_week: int
-    ) -> tuple[pd.DataFrame]:
-        # Store data in lists instead of continuous concatenation
-        all_team_data = []
-        all_player_data = []
-
-        # Loop through the years
-        for year in tqdm(range(start_year, self.current_season + 1), desc="Years"):
-            res = self.query_game_url()
-            game_links = []
-
-            # Determine the range of weeks to process
-            week_range = res.html.find(".statistics")
-
-            if year == self.current_season:
-                week_range = week_range[last_year_start_week - 1 :]
-
-            # Collect game URLs
-            for week in week_range:
-                for game in week.find("tbody tr"):
-                    game_link = game.find("a", first=True)
-                    if game_link:
-                        game_url = (
-                            str(game_link.links).replace("{'", "").replace("'}", "")
-                        )
-                        print("game_url: ", game_url)
-                        game_links.append(game_url)
-
-            # Parallel processing of games
-            with ThreadPoolExecutor() as executor:
-                future_to_url = {
-                    executor.submit(self.process_game, url): url for url in game_links
-                }
-                for future in tqdm(
-                    as_completed(future_to_url),
-                    desc="Games",
-                    total=len(game_links),
-                    leave=False,
-                    position=1,
-                ):
-                    team_data, player_data = future.result()
-                    all_team_data.append(team_data)
-                    all_player_data.append(player_data)
-
-        # Concatenate all data frames outside the loop
-        final_team_df = pd.concat(all_team_data, ignore_index=True)
-        final_player_df = pd.concat(all_player_data, ignore_index=True)
-
-        return [final_team_df, final_player_df]
-
-    def query_game_url(self):
-        return self.session.get(
-            f"https://www.footballdb.com/games/index.html?lg=NFL&yr={self.current_season}"
+        self,
+        start_year: int,
+        last_year_start_week: int,
+        engine: str = None,
+        writer: PartitionedWriter = None,
+        only_new: bool = False,
+    ) -> tuple[pd.DataFrame] | None:
+        engine = engine or self.engine
+        fetch_games = (
+            self.fetch_games_async if engine == "async" else self.fetch_games_threaded
+        )
+
+        years = []
+        for year in range(start_year, self.current_season + 1):
+            # Finished seasons already on disk survive an interrupted run
+            if (
+                writer is not None
+                and year != self.current_season
+                and writer.is_complete(year)
+            ):
+                tqdm.write(f"{year}: already scraped, skipping")
+                continue
+            years.append(year)
+
+        jobs.report(stage="Fetching schedules")
+        season_links = self.get_all_season_game_links(years, last_year_start_week)
+
+        # Every game of every season goes into one queue, in schedule order
+        game_seasons = {}
+        for year, game_links in season_links.items():
+            game_links = list(game_links)
+            # Partitions are rewritten whole, so they need every game of the
+            # season; already scraped games come back from the page cache
+            if only_new and writer is None:
+                game_links = self.manifest.unfinished(game_links)
+            game_seasons.update(dict.fromkeys(game_links, year))
+
+        game_order = {game_url: i for i, game_url in enumerate(game_seasons)}
+        game_frames = {}
+
+        def finish_season(year):
+            if writer is not None and not self.manifest.games(year, FAILED):
+                writer.finish_season(year)
+                self.manifest.mark_saved([year])
+
+        if writer is not None:
+            for year in years:
+                writer.start_season(year)
+
+        jobs.report(stage="Scraping games")
+        scheduler = SeasonScheduler(game_seasons, years, finish_season)
+
+        def handle_game(game_url, team_stats, player_stats):
+            if writer is not None:
+                writer.add(game_seasons[game_url], team_stats, player_stats)
+            else:
+                game_frames[game_order[game_url]] = (
+                    pd.DataFrame.from_dict([team_stats]),
+                    pd.DataFrame(
+                        [
+                            {"player": player, **stats}
+                            for player, stats in player_stats.items()
+                        ]
+                    ),
+                )
+            scheduler.game_done(game_url)
+
+        def handle_failure(game_url):
+            scheduler.game_done(game_url, failed=True)
+
+        try:
+            fetch_games(list(game_seasons), handle_game, handle_failure)
+        finally:
+            scheduler.close()
+            tqdm.write(self.throttle.summary())
+
+        if writer is not None:
+            writer.flush()
+            return None
+
+        # Games finish in any order, so put them back in schedule order
+        frames = [game_frames[i] for i in sorted(game_frames)]
+        final_team_df = pd.concat(
+            [team_df for team_df, _ in frames] or [pd.DataFrame()], ignore_index=True
+        )
+        final_player_df = pd.concat(
+            [player_df for _, player_df in frames] or [pd.DataFrame()],
+            ignore_index=True,
         )
 
+        return [
+            compact_frame(final_team_df, team_schema),
+            compact_frame(final_player_df, player_schema),
+        ]
+
+    @metrics.run("reparse_stale")
+    def reparse_stale(self, writer: PartitionedWriter = None) -> list[int]:
+        # Rebuilds every season holding games parsed by an older parser, using
+        # only cached pages
+        if self.cache is None:
+            raise ValueError("Re-parsing requires a page cache")
+
+        writer = writer or PartitionedWriter("scraped")
+        reparsed = []
+
+        for year in tqdm(self.manifest.stale_seasons(PARSE_VERSION), desc="Years"):
+            # Seasons are rewritten whole, so only stop between them
+            jobs.check_cancelled()
+            jobs.report(stage="Re-parsing", season=year)
+            # Games parsed by an interrupted re-parse belong to the season too
+            game_links = self.manifest.games(year, DONE) + self.manifest.games(
+                year, PARSED
+            )
+            pages = {
+                game_url: self.cache.get(f"{self.base_url}{game_url}")
+                for game_url in game_links
+            }
+            missing = [game_url for game_url, html in pages.items() if html is None]
+            if missing:
+                tqdm.write(f"{year}: {len(missing)} pages not cached, skipping")
+                continue
+
+            writer.start_season(year)
+            for game_url, html in tqdm(pages.items(), desc="Games", leave=False):
+                writer.add(year, *self.record_game(game_url, html))
+            writer.finish_season(year)
+            self.manifest.mark_saved([year])
+            reparsed.append(year)
+
+        return reparsed
+
+    def query_game_url(self, year: int = None):
+        year = year or self.current_season
+        url = f"{self.base_url}/games/index.html?lg=NFL&yr={year}"
+        # The schedule page keeps changing during the season
+        cacheable = year != self.current_season
+        return Page(self.fetch_page(url, cacheable=cacheable), url)
+
+    def get_all_season_game_links(
+        self, years: list[int], last_year_start_week: int
+    ) -> dict[int, dict[str, int]]:
+        # Season pages don't depend on each other, so fetch them all at once
+        def season_game_links(year):
+            start_week = last_year_start_week if year == self.current_season else 1
+            return self.get_season_game_links(year, start_week)
+
+        with ThreadPoolExecutor(self.throttle.max_concurrency) as executor:
+            season_links = list(
+                tqdm(
+                    executor.map(season_game_links, years),
+                    desc="Seasons",
+                    total=len(years),
+                )
+            )
+
+        return dict(zip(years, season_links))
+
     def get_last_played_week(self):
         response = self.query_game_url()
 
@@ -244,40 +620,116 @@ class GameGetter:
 
         return week_count
 
-    def read_scrape_info() -> tuple[int, int]:
-        with open("info.txt", "r") as file:
-            lines = file.readlines()
-            latest_scraped_year = int(lines[0].split("=")[1].strip())
-            latest_scraped_week = int(lines[1].split("=")[1].strip())
-            return latest_scraped_year, latest_scraped_week
+    @metrics.run("get_most_recent_games")
+    def get_most_recent_games(self):
+        # The manifest knows exactly which games were already saved, so only
+        # missing or failed games are fetched, from the latest scraped season
+        # onwards or from an earlier season that still has some. Games only
+        # count as saved once their rows are in the stats CSVs, so an
+        # interrupted run fetches them again next time
+        start_year = min(
+            season
+            for season in [
+                self.manifest.latest_season() or self.current_season,
+                self.manifest.earliest_unsaved_season(),
+            ]
+            if season is not None
+        )
+        seasons = list(range(start_year, self.current_season + 1))
+
+        team_df, player_df = self.get_games(start_year, 1, only_new=True)
+        if team_df.empty:
+            return
 
-    def write_scrape_info(self) -> None:
-        with open("info.txt", "w") as file:
-            file.write(f"latest_scraped_year = {self.current_season}\n")
-            file.write(f"latest_scraped_week = {self.last_finished_week}\n")
+        # Games are keyed by date and teams, so running this again changes
+        # nothing and a game scraped again replaces its old rows
+        team_file = KeyedStatsFile(
+            "team_stats.csv", ["date", "away_team", "home_team"], team_game_ids
+        )
+        player_file = KeyedStatsFile(
+            "player_stats.csv",
+            ["date", "team"],
+            lambda keys: player_game_ids(keys, team_file.read_keys()),
+        )
+        updates = [
+            ("team", team_file, team_df, team_game_ids(team_df)),
+            ("player", player_file, player_df, player_game_ids(player_df, team_df)),
+        ]
+        try:
+            for table, stats_file, df, game_ids in updates:
+                summary = stats_file.upsert(df, game_ids)
+                for outcome, games in summary.items():
+                    metrics.count("upserted_games", games, table=table, outcome=outcome)
+                tqdm.write(
+                    f"{table} stats: {summary['added']} games added, "
+                    f"{summary['replaced']} replaced"
+                )
+        finally:
+            team_file.close()
+            player_file.close()
 
-    #############################################################################
+        self.manifest.mark_saved(seasons)
 
-    def get_most_recent_games(self):
-        latest_scraped_year, latest_scraped_week = self.read_scrape_info()
+    @metrics.run("get_all_games")
+    def get_all_games(self):
+        writer = PartitionedWriter("scraped")
+        self.get_games(1978, 1, writer=writer)
 
-        recent_dfs = self.get_games(latest_scraped_year, latest_scraped_week + 1)
+        writer.combine("team", "team_stats.csv")
+        writer.combine("player", "player_stats.csv")
 
-        self.write_scrape_info()
+    @metrics.run("reparse_all_games")
+    def reparse_all_games(self):
+        writer = PartitionedWriter("scraped")
+        if self.reparse_stale(writer):
+            writer.combine("team", "team_stats.csv")
+            writer.combine("player", "player_stats.csv")
 
-        team_df = pd.read_csv("team_stats.csv")
-        player_df = pd.read_csv("player_stats.csv")
 
-        team_df = pd.concat([team_df, recent_dfs[0]], ignore_index=True)
-        player_df = pd.concat([player_df, recent_dfs[1]], ignore_index=True)
+def page_hash(html: str) -> str:
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
 
-        team_df.to_csv("team_stats_new.csv", header=False)
-        player_df.to_csv("player_stats_new.csv", header=False)
 
-    def get_all_games(self):
-        team_stats, player_stats = self.get_games(1978, 1)
+def parse_game_links(res: HTMLSession, start_week: int = 1) -> dict[str, int]:
+    game_links = {}
+
+    # Determine the range of weeks to process
+    week_range = res.html.find(".statistics")[start_week - 1 :]
+
+    # Collect game URLs along with the week they were played in
+    for week, games in enumerate(week_range, start=start_week):
+        for game in games.find("tbody tr"):
+            game_link = game.find("a", first=True)
+            if game_link:
+                game_url = str(game_link.links).replace("{'", "").replace("'}", "")
+                game_links[game_url] = week
 
-        team_stats.to_csv("team_stats.csv")
-        player_stats.to_csv("player_stats.csv")
+    return game_links
 
-        self.write_scrape_info()
+
+def parse_stats(
+    url: str, html: str, parser: str = "requests_html"
+) -> tuple[dict, dict]:
+    if parser == "lxml":
+        with metrics.timer("parse_seconds", metrics.parse_buckets, part="extract"):
+            game_info, score_line, team_stats_rows, player_stats = (
+                fast_parser.extract_game(html)
+            )
+        with metrics.timer("parse_seconds", metrics.parse_buckets, part="team"):
+            team_stats = build_team_stats(game_info, score_line, team_stats_rows)
+        with metrics.timer("parse_seconds", metrics.parse_buckets, part="player"):
+            return team_stats, build_player_stats(player_stats, team_stats)
+
+    res = Page(html, url)
+    with metrics.timer("parse_seconds", metrics.parse_buckets, part="team"):
+        team_stats = GameGetter.get_team_stats(res)
+    with metrics.timer("parse_seconds", metrics.parse_buckets, part="player"):
+        return team_stats, GameGetter.get_player_stats(res, team_stats)
+
+
+def measured_parse_stats(
+    url: str, html: str, parser: str = "requests_html"
+) -> tuple[tuple[dict, dict], dict]:
+    # Runs in a parsing process, so its timings go back with the stats
+    stats = parse_stats(url, html, parser)
+    return stats, metrics.drain()
@@ -0,0 +1,149 @@
+import sqlite3
+import threading
+
+import pandas as pd
+
+# Lookups the store is indexed for. Teams are matched by franchise, so a
+# team's games include those played under its earlier names
+indexes = {
+    "games_team": ["team", "season"],
+    "games_franchise": ["current_team", "season", "week"],
+    "games_opponent": ["opp_current_team", "season"],
+    "games_season_week": ["season", "week"],
+    "games_date": ["date"],
+}
+
+
+def column_type(values: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(values):
+        return "REAL"
+    return "TEXT"
+
+
+def column_values(values: pd.Series) -> list:
+    # sqlite3 only binds Python scalars, and missing values become NULL
+    if column_type(values) == "TEXT":
+        return values.astype(object).where(values.notna(), None).tolist()
+    return values.tolist()
+
+
+class GameStore:
+    # One row per team per game, as in the split stage, plus the season,
+    # week, ISO date and current franchise names
+    def __init__(self, path: str = "games.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+
+    def columns(self) -> list[str]:
+        with self._lock:
+            rows = self.connection.execute("PRAGMA table_info(games)").fetchall()
+        return [row[1] for row in rows]
+
+    def count(self) -> int:
+        if not self.columns():
+            return 0
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def rebuild(self, df: pd.DataFrame) -> None:
+        # df is indexed by split stage row and has the stage's columns plus
+        # season and current_team / opp_current_team
+        columns = ", ".join(f'"{col}" {column_type(df[col])}' for col in df.columns)
+
+        with self._lock, self.connection:
+            self.connection.execute("DROP TABLE IF EXISTS games")
+            self.connection.execute(
+                f"CREATE TABLE games (row_id INTEGER PRIMARY KEY, {columns}, week INTEGER)"
+            )
+            self._insert(df)
+            for name, cols in indexes.items():
+                self.connection.execute(
+                    f"CREATE INDEX {name} ON games ({', '.join(cols)})"
+                )
+
+    def upsert(self, df: pd.DataFrame) -> None:
+        if self.columns() != ["row_id", *df.columns, "week"]:
+            raise ValueError("Game store columns changed")
+
+        with self._lock, self.connection:
+            self._insert(df)
+
+    def _insert(self, df: pd.DataFrame) -> None:
+        columns = ", ".join(["row_id", *(f'"{col}"' for col in df.columns)])
+        params = ", ".join("?" * (len(df.columns) + 1))
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO games ({columns}) VALUES ({params})",
+            zip(df.index.tolist(), *(column_values(df[col]) for col in df.columns)),
+        )
+
+        # Weeks run Wednesday to Tuesday from the season's opening game, so
+        # a season's weeks are renumbered whenever its games change
+        seasons = sorted({int(season) for season in df["season"].dropna()})
+        self.connection.execute(
+            f"""
+            WITH openers AS (
+                SELECT season, MIN(date) AS opener FROM games
+                WHERE season IN ({", ".join("?" * len(seasons))})
+                GROUP BY season
+            )
+            UPDATE games SET week = (
+                SELECT CAST(
+                    (julianday(games.date) - julianday(opener)
+                        + (CAST(strftime('%w', opener) AS INTEGER) + 4) % 7) / 7
+                    AS INTEGER) + 1
+                FROM openers WHERE openers.season = games.season
+            )
+            WHERE season IN ({", ".join("?" * len(seasons))})
+            """,
+            seasons + seasons,
+        )
+
+    def franchise(self, team: str) -> str:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT current_team FROM games WHERE team = ? LIMIT 1", (team,)
+            ).fetchone()
+        return row[0] if row and row[0] is not None else team
+
+    def query(self, sql: str, params: tuple | list = ()) -> pd.DataFrame:
+        with self._lock:
+            return pd.read_sql_query(sql, self.connection, params=params)
+
+    def team_games(self, team: str, season: int | None = None) -> pd.DataFrame:
+        sql = "SELECT * FROM games WHERE current_team = ?"
+        params = [self.franchise(team)]
+        if season is not None:
+            sql += " AND season = ?"
+            params.append(season)
+        return self.query(sql + " ORDER BY date", params)
+
+    def head_to_head(
+        self, team: str, opponent: str, since: int | None = None
+    ) -> pd.DataFrame:
+        # Each game once, from team's side
+        sql = "SELECT * FROM games WHERE current_team = ? AND opp_current_team = ?"
+        params = [self.franchise(team), self.franchise(opponent)]
+        if since is not None:
+            sql += " AND season >= ?"
+            params.append(since)
+        return self.query(sql + " ORDER BY date", params)
+
+    def week_games(self, season: int, week: int) -> pd.DataFrame:
+        # Both teams' rows for every game that week
+        return self.query(
+            "SELECT * FROM games WHERE season = ? AND week = ? ORDER BY row_id",
+            (season, week),
+        )
+
+    def games_between(self, start: str, end: str) -> pd.DataFrame:
+        # Dates are ISO strings, so "2023-09-01" to "2023-12-31" works
+        return self.query(
+            "SELECT * FROM games WHERE date BETWEEN ? AND ? ORDER BY row_id",
+            (start, end),
+        )
+
+    def close(self) -> None:
+        self.connection.close()
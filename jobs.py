@@ -0,0 +1,116 @@
+import queue
+import threading
+
+# The job running on the worker thread, if any. Scraping and transforming
+# report progress to it and check it for cancellation between units of work
+current = None
+
+
+class JobCancelled(BaseException):
+    # A BaseException so the per-game `except Exception` handlers let it
+    # through instead of recording the game as failed
+    pass
+
+
+class Job:
+    def __init__(self, name: str, function):
+        self.name = name
+        self.function = function
+        self.state = "queued"
+        self.progress = {}
+        self.error = None
+        self.cancelled = threading.Event()
+        self.on_change = None
+
+    def report(self, **progress) -> None:
+        self.progress = {**self.progress, **progress}
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def check(self) -> None:
+        if self.cancelled.is_set():
+            raise JobCancelled(self.name)
+
+
+def report(**progress) -> None:
+    job = current
+    if job is not None:
+        job.report(**progress)
+
+
+def check_cancelled() -> None:
+    job = current
+    if job is not None:
+        job.check()
+
+
+class JobQueue:
+    # Runs submitted jobs one at a time on a worker thread, calling
+    # `on_change(job)` from that thread whenever a job moves on
+    def __init__(self, on_change):
+        self.on_change = on_change
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self.pending = []
+        self.running = None
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def submit(self, name: str, function) -> Job:
+        job = Job(name, function)
+        job.on_change = self.on_change
+        with self._lock:
+            self.pending.append(job)
+        self._jobs.put(job)
+        self.on_change(job)
+        return job
+
+    def cancel(self) -> None:
+        # Stops the running job at its next checkpoint and drops the rest
+        with self._lock:
+            jobs = [self.running, *self.pending]
+        for job in jobs:
+            if job is not None:
+                job.cancel()
+
+    def close(self) -> None:
+        # Waits for the running job to reach a checkpoint, so nothing is left
+        # half written
+        self.cancel()
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _work(self) -> None:
+        global current
+
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            with self._lock:
+                self.pending.remove(job)
+                self.running = job
+
+            if job.cancelled.is_set():
+                job.state = "cancelled"
+            else:
+                job.state = "running"
+                self.on_change(job)
+                current = job
+                try:
+                    job.function()
+                    job.state = "finished"
+                except JobCancelled:
+                    job.state = "cancelled"
+                except Exception as error:
+                    job.state = "failed"
+                    job.error = error
+                finally:
+                    current = None
+
+            with self._lock:
+                self.running = None
+            self.on_change(job)
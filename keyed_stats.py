@@ -0,0 +1,309 @@
+import csv
+import hashlib
+import os
+import re
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+copy_chunk_bytes = 1024**2
+
+# A field such as 61234.0
+whole_number_pattern = re.compile(rb"(?<![^,])(-?\d+)\.0(?=,|\r?\n|$)")
+
+# Bump whenever block_hash changes, so indexes are rebuilt with new hashes
+index_version = 2
+
+
+def team_game_ids(df: pd.DataFrame) -> pd.Series:
+    # A game is its date and teams, which read the same however often its
+    # page is parsed
+    return (
+        df["date"].astype(str)
+        + "|"
+        + df["away_team"].astype(str)
+        + "|"
+        + df["home_team"].astype(str)
+    )
+
+
+def player_game_ids(df: pd.DataFrame, team_df: pd.DataFrame) -> pd.Series:
+    # Player rows only name their own team, which plays once a day
+    ids = team_game_ids(team_df).to_numpy()
+    sides = pd.concat(
+        [
+            pd.Series(
+                ids, index=[team_df["date"].astype(str), team_df[side].astype(str)]
+            )
+            for side in ("away_team", "home_team")
+        ]
+    )
+    sides = sides[~sides.index.duplicated(keep="last")]
+
+    keys = pd.MultiIndex.from_arrays([df["date"].astype(str), df["team"].astype(str)])
+    game_ids = pd.Series(sides.reindex(keys).to_numpy(), index=df.index)
+    return game_ids.fillna(df["date"].astype(str) + "|" + df["team"].astype(str))
+
+
+def render_rows(df: pd.DataFrame) -> list[bytes]:
+    lines = df.to_csv(index=False, header=False).encode().splitlines(keepends=True)
+    if len(lines) != len(df):
+        raise ValueError("Stats rows must each fit on one line")
+    return lines
+
+
+def numbered(position: int, row: bytes) -> bytes:
+    return f"{position},".encode() + row
+
+
+def without_number(line: bytes) -> bytes:
+    return line.split(b",", 1)[1]
+
+
+def block_hash(rows: list[bytes]) -> str:
+    # A column is float in a batch where it's missing for some game and int
+    # otherwise, so a whole number hashes the same written either way
+    text = whole_number_pattern.sub(rb"\1", b"".join(rows))
+    return hashlib.sha256(text).hexdigest()
+
+
+class KeyedStatsFile:
+    # A scraped stats CSV, as get_all_games writes it, with an index of where
+    # each game's rows are. New games are appended and a game whose rows
+    # changed is replaced where it is, so later rows keep their positions and
+    # only what follows it is rewritten, into a copy that replaces the file
+    # once it's complete. The index is rebuilt from the CSV
+    # whenever the CSV was written by something else
+    def __init__(
+        self,
+        path: str,
+        key_columns: list[str],
+        game_ids,
+        index_path: str | None = None,
+    ):
+        self.path = Path(path)
+        self.key_columns = key_columns
+        # Maps a frame of key_columns to each row's game id
+        self.game_ids = game_ids
+        self.index_path = index_path or self.path.with_suffix(".index.db")
+        self.connection = sqlite3.connect(self.index_path)
+
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS games (
+                    game_id TEXT PRIMARY KEY,
+                    position INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    rows INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL
+                )
+                """)
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS games_position ON games (position)"
+            )
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS file (
+                    size INTEGER, mtime_ns INTEGER, header BLOB, total_rows INTEGER
+                )
+                """)
+
+    def read_keys(self) -> pd.DataFrame:
+        return pd.read_csv(
+            self.path, usecols=self.key_columns, dtype=str, keep_default_na=False
+        )
+
+    def state(self) -> tuple | None:
+        return self.connection.execute(
+            "SELECT size, mtime_ns, header, total_rows FROM file"
+        ).fetchone()
+
+    def is_indexed(self) -> bool:
+        state = self.state()
+        if state is None or not self.path.exists():
+            return False
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != index_version:
+            return False
+        stat = self.path.stat()
+        return state[:2] == (stat.st_size, stat.st_mtime_ns)
+
+    def columns(self) -> list[str]:
+        header = self.state()[2].decode()
+        return next(csv.reader([header]))[1:]
+
+    def reindex(self) -> None:
+        data = self.path.read_bytes()
+        header, *lines = data.splitlines(keepends=True)
+        game_ids = self.game_ids(self.read_keys()).tolist()
+        if len(game_ids) != len(lines):
+            raise ValueError(f"{self.path}: stats rows must each fit on one line")
+
+        # Each run of a game's rows is one block. A game written again as it
+        # was is dropped, but two different sets of rows for one game can't be
+        # told apart from two games sharing a key
+        blocks = {}
+        start = 0
+        for end in range(1, len(lines) + 1):
+            if end == len(lines) or game_ids[end] != game_ids[start]:
+                game_id = game_ids[start]
+                rows = [without_number(line) for line in lines[start:end]]
+                if blocks.setdefault(game_id, rows) != rows:
+                    raise ValueError(
+                        f"{self.path}: game {game_id} has more than one set of rows"
+                    )
+                start = end
+
+        content = [header]
+        entries = []
+        position = 0
+        offset = len(header)
+        for game_id, rows in blocks.items():
+            block = [numbered(position + i, row) for i, row in enumerate(rows)]
+            content.extend(block)
+            entries.append((game_id, position, offset, len(rows), block_hash(rows)))
+            position += len(rows)
+            offset += sum(map(len, block))
+
+        content = b"".join(content)
+        if content != data:
+            partial = self.path.with_name(f".{self.path.name}.tmp")
+            partial.write_bytes(content)
+            partial.replace(self.path)
+
+        with self.connection:
+            self.connection.execute("DELETE FROM games")
+            self._record(entries, header, position)
+
+    def create(self, columns: list[str]) -> None:
+        header = pd.DataFrame(columns=columns).to_csv().encode()
+        self.path.write_bytes(header)
+        with self.connection:
+            self.connection.execute("DELETE FROM games")
+            self._record([], header, 0)
+
+    def add_columns(self, columns: list[str]) -> None:
+        # Games with stats the file has no column for yet; every row is
+        # rewritten with the new columns left empty
+        df = pd.read_csv(self.path, index_col=0, dtype=str, keep_default_na=False)
+        df = df.reindex(columns=[*df.columns, *columns], fill_value="")
+        partial = self.path.with_name(f".{self.path.name}.tmp")
+        df.to_csv(partial)
+        partial.replace(self.path)
+        self.reindex()
+
+    def upsert(self, df: pd.DataFrame, game_ids: pd.Series) -> dict:
+        # Returns how many games were added, replaced and already up to date
+        if not self.path.exists():
+            self.create(list(df.columns))
+        elif not self.is_indexed():
+            self.reindex()
+
+        columns = self.columns()
+        extra = [col for col in df.columns if col not in columns]
+        if extra:
+            self.add_columns(extra)
+            columns += extra
+
+        blocks = {}
+        for game_id, row in zip(game_ids, render_rows(df.reindex(columns=columns))):
+            blocks.setdefault(game_id, []).append(row)
+
+        added = {}
+        replaced = {}
+        for game_id, rows in blocks.items():
+            known = self.connection.execute(
+                "SELECT position, fingerprint FROM games WHERE game_id = ?",
+                (game_id,),
+            ).fetchone()
+            if known is None:
+                added[game_id] = rows
+            elif known[1] != block_hash(rows):
+                replaced[game_id] = (known[0], rows)
+
+        summary = {
+            "added": len(added),
+            "replaced": len(replaced),
+            "unchanged": len(blocks) - len(added) - len(replaced),
+        }
+        if not added and not replaced:
+            return summary
+
+        _, _, header, total_rows = self.state()
+        if replaced:
+            start = min(position for position, _ in replaced.values())
+            tail = self.connection.execute(
+                """
+                SELECT game_id, offset, rows FROM games
+                WHERE position >= ? ORDER BY position
+                """,
+                (start,),
+            ).fetchall()
+            offset = tail[0][1]
+            with open(self.path, "rb") as file:
+                file.seek(offset)
+                lines = file.read().splitlines(keepends=True)
+
+            # Games after the first replaced one are written again, each with
+            # its new rows if it has them
+            rewritten = {}
+            line = 0
+            for game_id, _, row_count in tail:
+                if game_id in replaced:
+                    rewritten[game_id] = replaced[game_id][1]
+                else:
+                    rewritten[game_id] = [
+                        without_number(row) for row in lines[line : line + row_count]
+                    ]
+                line += row_count
+            rewritten.update(added)
+            position = start
+        else:
+            rewritten = added
+            offset = self.path.stat().st_size
+            position = total_rows
+
+        content = []
+        entries = []
+        block_offset = offset
+        for game_id, rows in rewritten.items():
+            block = [numbered(position + i, row) for i, row in enumerate(rows)]
+            content.extend(block)
+            entries.append(
+                (game_id, position, block_offset, len(rows), block_hash(rows))
+            )
+            position += len(rows)
+            block_offset += sum(map(len, block))
+
+        # The rows before offset are copied as they are into a new file, which
+        # only replaces the old one once it's complete and on disk
+        partial = self.path.with_name(f".{self.path.name}.tmp")
+        with open(self.path, "rb") as source, open(partial, "wb") as file:
+            remaining = offset
+            while remaining:
+                chunk = source.read(min(remaining, copy_chunk_bytes))
+                file.write(chunk)
+                remaining -= len(chunk)
+            file.write(b"".join(content))
+            file.flush()
+            os.fsync(file.fileno())
+        partial.replace(self.path)
+
+        with self.connection:
+            self._record(entries, header, position)
+        return summary
+
+    def _record(self, entries: list[tuple], header: bytes, total_rows: int) -> None:
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?)", entries
+        )
+        stat = self.path.stat()
+        self.connection.execute(f"PRAGMA user_version = {index_version}")
+        self.connection.execute("DELETE FROM file")
+        self.connection.execute(
+            "INSERT INTO file VALUES (?, ?, ?, ?)",
+            (stat.st_size, stat.st_mtime_ns, header, total_rows),
+        )
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,136 @@
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+PENDING = "pending"
+# Parsed, but its rows aren't saved anywhere yet, so it's scraped again
+PARSED = "parsed"
+DONE = "done"
+FAILED = "failed"
+
+
+class ScrapeManifest:
+    def __init__(self, path: str = "manifest.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS games (
+                    url TEXT PRIMARY KEY,
+                    season INTEGER NOT NULL,
+                    week INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    fetched_at TEXT,
+                    content_hash TEXT,
+                    parse_version INTEGER,
+                    error TEXT
+                )
+                """)
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS games_season_status ON games (season, status)"
+            )
+
+    def add_games(self, games: dict[str, int], season: int) -> None:
+        # New games start out pending; known games keep their status
+        with self._lock, self.connection:
+            self.connection.executemany(
+                """
+                INSERT INTO games (url, season, week) VALUES (?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET season = excluded.season,
+                    week = excluded.week
+                """,
+                [(url, season, week) for url, week in games.items()],
+            )
+
+    def mark_parsed(self, url: str, content_hash: str, parse_version: int) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                """
+                UPDATE games SET status = ?, fetched_at = ?, content_hash = ?,
+                    parse_version = ?, error = NULL
+                WHERE url = ?
+                """,
+                (
+                    PARSED,
+                    datetime.now(timezone.utc).isoformat(),
+                    content_hash,
+                    parse_version,
+                    url,
+                ),
+            )
+
+    def mark_saved(self, seasons: list[int]) -> None:
+        # Called once the parsed games of these seasons are written out
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "UPDATE games SET status = ? WHERE season = ? AND status = ?",
+                [(DONE, season, PARSED) for season in seasons],
+            )
+
+    def mark_failed(self, url: str, error: str) -> None:
+        with self._lock, self.connection:
+            self.connection.execute(
+                "UPDATE games SET status = ?, error = ? WHERE url = ?",
+                (FAILED, error, url),
+            )
+
+    def status(self, url: str) -> str | None:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT status FROM games WHERE url = ?", (url,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def unfinished(self, urls: list[str]) -> list[str]:
+        with self._lock:
+            done = {
+                url
+                for (url,) in self.connection.execute(
+                    "SELECT url FROM games WHERE status = ?", (DONE,)
+                )
+            }
+        return [url for url in urls if url not in done]
+
+    def games(self, season: int, status: str | None = None) -> list[str]:
+        query = "SELECT url FROM games WHERE season = ?"
+        params = [season]
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+
+        with self._lock:
+            return [url for (url,) in self.connection.execute(query, params)]
+
+    def stale_seasons(self, parse_version: int) -> list[int]:
+        with self._lock:
+            return [
+                season
+                for (season,) in self.connection.execute(
+                    """
+                    SELECT DISTINCT season FROM games
+                    WHERE status = ? AND parse_version < ?
+                    ORDER BY season
+                    """,
+                    (DONE, parse_version),
+                )
+            ]
+
+    def latest_season(self) -> int | None:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT MAX(season) FROM games WHERE status = ?", (DONE,)
+            ).fetchone()
+        return row[0]
+
+    def earliest_unsaved_season(self) -> int | None:
+        # Oldest season with a game that's pending, failed or not saved yet
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT MIN(season) FROM games WHERE status != ?", (DONE,)
+            ).fetchone()
+        return row[0]
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,313 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Where each run writes its metrics: JSON, or a Prometheus textfile when the
+# name ends in .prom. None turns exporting off
+export_path = "metrics.json"
+# Set to a file name to profile each run with cProfile, on the thread that
+# started it, and dump the stats there for pstats or snakeviz
+profile_path = None
+
+latency_buckets = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+parse_buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1]
+
+memory_interval = 0.02
+
+
+def rss_bytes() -> int | None:
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.stages = {}
+        self.stage = None
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: list, **labels) -> None:
+        key = (name, label_key(labels))
+        with self._lock:
+            histogram = self.histograms.setdefault(
+                key,
+                {
+                    "buckets": buckets,
+                    "counts": [0] * len(buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                },
+            )
+            for i, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def drain(self) -> dict:
+        # Hands over counters and histograms recorded so far and starts again,
+        # for a worker process to send its share back to the main one
+        with self._lock:
+            recorded = {"counters": self.counters, "histograms": self.histograms}
+            self.counters = {}
+            self.histograms = {}
+        return recorded
+
+    def merge(self, recorded: dict) -> None:
+        with self._lock:
+            for key, value in recorded["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, other in recorded["histograms"].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = other
+                    continue
+                histogram["counts"] = [
+                    a + b for a, b in zip(histogram["counts"], other["counts"])
+                ]
+                histogram["sum"] += other["sum"]
+                histogram["count"] += other["count"]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram}
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ],
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+            }
+
+
+current = Metrics()
+_runs = 0
+_runs_lock = threading.Lock()
+
+
+def count(name: str, value: float = 1, **labels) -> None:
+    current.count(name, value, **labels)
+
+
+def observe(name: str, value: float, buckets: list = latency_buckets, **labels):
+    current.observe(name, value, buckets, **labels)
+
+
+@contextmanager
+def timer(name: str, buckets: list = latency_buckets, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.observe(name, time.perf_counter() - started, buckets, **labels)
+
+
+def rows(output: str, count: int) -> None:
+    # Rows written to output by the stage that's running, if any
+    stage = current.stage
+    if stage is not None:
+        stage["rows"][output] = count
+
+
+def request(
+    latency: float, status: int | None = None, size: int = 0, error=None
+) -> None:
+    # One attempt at a download, whatever came of it
+    observe("request_seconds", latency)
+    if error is not None:
+        count("request_errors", error=type(error).__name__)
+        return
+    count("responses", status=status)
+    count("downloaded_bytes", size)
+
+
+def drain() -> dict:
+    return current.drain()
+
+
+def merge(recorded: dict) -> None:
+    current.merge(recorded)
+
+
+def reset() -> None:
+    global current
+    current = Metrics()
+
+
+@contextmanager
+def stage(name: str):
+    # Wall time, rows written and the process's peak resident memory, sampled
+    # in the background while the stage runs
+    record = {"wall_s": None, "rows": {}, "peak_rss_mb": None}
+    current.stage = record
+    finished = threading.Event()
+    peak = [rss_bytes()]
+
+    def sample():
+        while not finished.wait(memory_interval):
+            peak[0] = max(peak[0], rss_bytes())
+
+    sampler = None
+    if peak[0] is not None:
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["wall_s"] = time.perf_counter() - started
+        finished.set()
+        if sampler is not None:
+            sampler.join()
+            record["peak_rss_mb"] = max(peak[0], rss_bytes()) / 1024**2
+        current.stage = None
+        current.stages[name] = record
+
+
+@contextmanager
+def run(name: str):
+    # Collects metrics for one scrape or transformation and exports them when
+    # it ends, however it ends. Runs started inside another run join it
+    global _runs
+
+    with _runs_lock:
+        _runs += 1
+        outermost = _runs == 1
+    if not outermost:
+        try:
+            yield
+        finally:
+            with _runs_lock:
+                _runs -= 1
+        return
+
+    reset()
+    profiler = cProfile.Profile() if profile_path else None
+    started_at = datetime.now(timezone.utc).isoformat()
+    started = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        with _runs_lock:
+            _runs -= 1
+        if export_path:
+            export(
+                export_path,
+                run=name,
+                started_at=started_at,
+                wall_s=time.perf_counter() - started,
+            )
+
+
+def prometheus_name(name: str) -> str:
+    return f"nfl_{name}"
+
+
+def prometheus_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = {
+        name: str(value).replace("\\", "\\\\").replace('"', '\\"')
+        for name, value in labels.items()
+    }
+    text = ",".join(f'{name}="{value}"' for name, value in escaped.items())
+    return f"{{{text}}}"
+
+
+def to_prometheus(snapshot: dict) -> str:
+    lines = []
+    typed = set()
+
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for counter in snapshot["counters"]:
+        name = prometheus_name(counter["name"]) + "_total"
+        header(name, "counter")
+        lines.append(f"{name}{prometheus_labels(counter['labels'])} {counter['value']}")
+
+    for histogram in snapshot["histograms"]:
+        name = prometheus_name(histogram["name"])
+        header(name, "histogram")
+        # Bucket counts are already cumulative
+        for bound, bucket_count in zip(histogram["buckets"], histogram["counts"]):
+            labels = prometheus_labels({**histogram["labels"], "le": bound})
+            lines.append(f"{name}_bucket{labels} {bucket_count}")
+        labels = prometheus_labels({**histogram["labels"], "le": "+Inf"})
+        lines.append(f"{name}_bucket{labels} {histogram['count']}")
+        labels = prometheus_labels(histogram["labels"])
+        lines.append(f"{name}_sum{labels} {histogram['sum']}")
+        lines.append(f"{name}_count{labels} {histogram['count']}")
+
+    # Each family's samples have to stay together
+    stages = snapshot["stages"]
+    if stages:
+        header("nfl_stage_seconds", "gauge")
+    for stage_name, record in stages.items():
+        labels = prometheus_labels({"stage": stage_name})
+        lines.append(f"nfl_stage_seconds{labels} {record['wall_s']}")
+
+    for stage_name, record in stages.items():
+        if record["peak_rss_mb"] is not None:
+            header("nfl_stage_peak_rss_bytes", "gauge")
+            labels = prometheus_labels({"stage": stage_name})
+            peak = int(record["peak_rss_mb"] * 1024**2)
+            lines.append(f"nfl_stage_peak_rss_bytes{labels} {peak}")
+
+    for stage_name, record in stages.items():
+        for output, output_rows in record["rows"].items():
+            header("nfl_stage_rows", "gauge")
+            labels = prometheus_labels({"stage": stage_name, "output": output})
+            lines.append(f"nfl_stage_rows{labels} {output_rows}")
+
+    return "\n".join(lines) + "\n"
+
+
+def export(path: str, **run_info) -> None:
+    snapshot = {**run_info, **current.snapshot()}
+    path = Path(path)
+    if path.suffix == ".prom":
+        text = to_prometheus(snapshot)
+    else:
+        text = json.dumps(snapshot, indent=2)
+
+    # Scrapers of textfiles may read at any moment, so never show a half file
+    partial = path.with_name(path.name + ".tmp")
+    partial.write_text(text)
+    partial.replace(path)
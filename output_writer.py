@@ -0,0 +1,154 @@
+import shutil
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from compact import compact_frame, player_schema, team_schema
+
+try:
+    import pyarrow.parquet as pq
+
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+tables = ["team", "player"]
+schemas = {"team": team_schema, "player": player_schema}
+
+
+class PartitionedWriter:
+    def __init__(
+        self,
+        directory: str = "scraped",
+        batch_size: int = 256,
+        file_format: str | None = None,
+    ):
+        if file_format is None:
+            file_format = "parquet" if PARQUET_AVAILABLE else "csv"
+        if file_format not in ("parquet", "csv"):
+            raise ValueError(f"Unknown file format: {file_format}")
+        if file_format == "parquet" and not PARQUET_AVAILABLE:
+            raise ValueError("Writing parquet requires pyarrow")
+
+        self.directory = Path(directory)
+        self.batch_size = batch_size
+        self.file_format = file_format
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._buffered_games = 0
+        self._part_counts = {}
+
+    def partition(self, table: str, season: int) -> Path:
+        return self.directory / table / f"season={season}"
+
+    def marker(self, season: int) -> Path:
+        return self.directory / "_complete" / str(season)
+
+    def is_complete(self, season: int) -> bool:
+        return self.marker(season).exists()
+
+    def start_season(self, season: int) -> None:
+        # Drop whatever a previous, possibly interrupted, run left behind
+        with self._lock:
+            self.marker(season).unlink(missing_ok=True)
+            self._buffers.pop(season, None)
+            for table in tables:
+                shutil.rmtree(self.partition(table, season), ignore_errors=True)
+                self._part_counts.pop((table, season), None)
+
+    def finish_season(self, season: int) -> None:
+        with self._lock:
+            self._flush_season(season)
+            self.marker(season).parent.mkdir(parents=True, exist_ok=True)
+            self.marker(season).touch()
+
+    def add(self, season: int, team_stats: dict, player_stats: dict) -> None:
+        with self._lock:
+            team_rows, player_rows = self._buffers.setdefault(season, ([], []))
+            team_rows.append(team_stats)
+            player_rows.extend(
+                {"player": player, **stats} for player, stats in player_stats.items()
+            )
+            self._buffered_games += 1
+
+            if self._buffered_games >= self.batch_size:
+                for buffered_season in list(self._buffers):
+                    self._flush_season(buffered_season)
+
+    def flush(self) -> None:
+        with self._lock:
+            for season in list(self._buffers):
+                self._flush_season(season)
+
+    def _flush_season(self, season: int) -> None:
+        team_rows, player_rows = self._buffers.pop(season, ([], []))
+        self._buffered_games -= len(team_rows)
+
+        for table, rows in zip(tables, [team_rows, player_rows]):
+            if rows:
+                df = compact_frame(pd.DataFrame(rows), schemas[table])
+                self._write_part(table, season, df)
+
+    def _write_part(self, table: str, season: int, df: pd.DataFrame) -> None:
+        partition = self.partition(table, season)
+        partition.mkdir(parents=True, exist_ok=True)
+
+        key = (table, season)
+        if key not in self._part_counts:
+            self._part_counts[key] = len(list(partition.glob("part-*")))
+        part = self._part_counts[key]
+        self._part_counts[key] += 1
+
+        path = partition / f"part-{part:05d}.{self.file_format}"
+        tmp_path = partition / f".{path.name}.tmp"
+        if self.file_format == "parquet":
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_csv(tmp_path, index=False)
+        tmp_path.replace(path)
+
+    def seasons(self, table: str) -> list[int]:
+        table_dir = self.directory / table
+        if not table_dir.exists():
+            return []
+        return sorted(
+            int(partition.name.split("=")[1])
+            for partition in table_dir.glob("season=*")
+        )
+
+    def read_season(self, table: str, season: int) -> pd.DataFrame:
+        parts = sorted(self.partition(table, season).glob("part-*"))
+        frames = [
+            (
+                pd.read_parquet(part)
+                if part.suffix == ".parquet"
+                else pd.read_csv(part, dtype=str, keep_default_na=False)
+            )
+            for part in parts
+        ]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def columns(self, table: str) -> list[str]:
+        columns = {}
+        for season in self.seasons(table):
+            for part in sorted(self.partition(table, season).glob("part-*")):
+                if part.suffix == ".parquet":
+                    names = pq.read_schema(part).names
+                else:
+                    names = pd.read_csv(part, nrows=0).columns
+                columns.update(dict.fromkeys(names))
+        return list(columns)
+
+    def combine(self, table: str, output_file: str) -> None:
+        # Stream one season at a time into a single CSV with a running index,
+        # matching the layout the transformers expect
+        columns = self.columns(table)
+        offset = 0
+
+        with open(output_file, "w", newline="") as file:
+            for i, season in enumerate(self.seasons(table)):
+                df = self.read_season(table, season).reindex(columns=columns)
+                df.index = pd.RangeIndex(offset, offset + len(df))
+                df.to_csv(file, header=i == 0)
+                offset += len(df)
@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+
+class PageNotCached(Exception):
+    pass
+
+
+class PageCache:
+    def __init__(
+        self,
+        directory: str = "page_cache",
+        max_bytes: int = 1024**3,
+        offline: bool = False,
+    ):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._size = None
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def path(self, url: str) -> Path:
+        key = self.key(url)
+        return self.directory / key[:2] / f"{key}.html.gz"
+
+    def __contains__(self, url: str) -> bool:
+        return self.path(url).exists()
+
+    def get(self, url: str) -> str | None:
+        path = self.path(url)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                html = file.read()
+        except FileNotFoundError:
+            return None
+
+        # Bump the modification time so eviction drops least recently used pages
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return html
+
+    def put(self, url: str, html: str) -> None:
+        path = self.path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial page
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as file:
+            file.write(html)
+
+        with self._lock:
+            size = self.size
+            if path.exists():
+                size -= path.stat().st_size
+            os.replace(tmp_path, path)
+            self._size = size + path.stat().st_size
+
+            if self._size > self.max_bytes:
+                self.evict()
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            self._size = sum(path.stat().st_size for path in self.pages())
+        return self._size
+
+    def pages(self) -> list[Path]:
+        if not self.directory.exists():
+            return []
+        return list(self.directory.glob("*/*.html.gz"))
+
+    def evict(self) -> None:
+        # Trim to 90% of the cap so a full cache doesn't evict on every write
+        target = self.max_bytes * 0.9
+        pages = sorted(
+            ((path.stat(), path) for path in self.pages()),
+            key=lambda page: page[0].st_mtime,
+        )
+
+        for stat, path in pages:
+            if self._size <= target:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= stat.st_size
+
+    def get_or_fetch(self, url: str, fetch, cacheable: bool = True) -> str:
+        # Pages that can still change (e.g. the current season's schedule) are
+        # only served from the cache in offline mode, but are always stored
+        if cacheable or self.offline:
+            html = self.get(url)
+            if html is not None:
+                return html
+
+        if self.offline:
+            raise PageNotCached(url)
+
+        html = fetch(url)
+        self.put(url, html)
+        return html
@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import Counter
+
+from tqdm import tqdm
+
+import jobs
+
+
+class SeasonScheduler:
+    # Follows the games of many seasons through one shared work queue, so a
+    # season can be finished as soon as its last game is in no matter what
+    # else is still running
+    def __init__(self, game_seasons: dict[str, int], seasons: list[int], on_finish):
+        self.game_seasons = game_seasons
+        self.on_finish = on_finish
+        self.totals = Counter(game_seasons.values())
+        self.remaining = Counter(game_seasons.values())
+        self.failed = Counter()
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.progress = tqdm(total=len(game_seasons), desc="Games", position=1)
+
+        for season in seasons:
+            if not self.remaining[season]:
+                self.finish(season)
+
+    def game_done(self, game_url: str, failed: bool = False) -> None:
+        season = self.game_seasons[game_url]
+
+        with self._lock:
+            self.remaining[season] -= 1
+            if failed:
+                self.failed[season] += 1
+            self.progress.update()
+            done = self.progress.n
+            finished = not self.remaining[season]
+
+        elapsed = time.perf_counter() - self.started
+        jobs.report(
+            season=season,
+            games=f"{done}/{len(self.game_seasons)}",
+            games_per_s=round(done / elapsed, 1),
+        )
+
+        if finished:
+            self.finish(season)
+        # Only after finishing, so a completed season is always recorded
+        jobs.check_cancelled()
+
+    def finish(self, season: int) -> None:
+        elapsed = time.perf_counter() - self.started
+        games = self.totals[season]
+        failed = f", {self.failed[season]} failed" if self.failed[season] else ""
+        tqdm.write(f"{season}: {games} games done after {elapsed:.1f}s{failed}")
+        self.on_finish(season)
+
+    def close(self) -> None:
+        self.progress.close()
+        elapsed = time.perf_counter() - self.started
+        games = self.progress.n
+        if games and elapsed > 0:
+            tqdm.write(
+                f"{games} games in {elapsed:.1f}s ({games / elapsed:.1f} games/s)"
+            )
@@ -0,0 +1,118 @@
+from pathlib import Path
+
+import pandas as pd
+
+import metrics
+from compact import compact_frame
+
+stores = ["csv", "parquet", "arrow"]
+
+# Columns held as categoricals or booleans at each stage; every other column
+# must be numeric and is narrowed to the smallest type that holds it. Stages
+# are read and written with these dtypes whatever the store, instead of
+# leaving types to be re-inferred from text by the next stage.
+stage_schemas = {
+    "expanded_team_stats": {
+        "category": ["away_team", "home_team", "date", "stadium"],
+        "bool": ["overtime"],
+    },
+    "expanded_split_team_stats": {
+        "category": ["team", "opponent", "team_team", "opp_team", "date", "stadium"],
+        "bool": ["overtime"],
+    },
+    "staggered_team_stats": {
+        "category": [
+            "team",
+            "opponent",
+            "prev_team_team",
+            "prev_opp_team",
+            "date",
+            "stadium",
+            "current_team",
+            "opp_current_team",
+        ],
+        "bool": ["prev_overtime"],
+    },
+    "preprocessed_team_stats": {
+        "category": ["prev_team_team", "prev_opp_team"],
+        "bool": [],
+    },
+    "normalized_player_stats": {
+        "category": ["player", "team", "date"],
+        "bool": [],
+    },
+    "aggregated_player_stats": {
+        "category": ["player", "team", "date"],
+        "bool": [],
+    },
+    "transform_state": {"category": [], "bool": []},
+}
+
+
+def stage_path(name: str, store: str) -> Path:
+    if store not in stores:
+        raise ValueError(f"Unknown store: {store}")
+    return Path(f"{name}.{store}")
+
+
+def apply_schema(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    try:
+        return compact_frame(df, stage_schemas[name], strict=True)
+    except ValueError as error:
+        raise ValueError(f"{name}: {error}") from error
+
+
+def write_stage(
+    df: pd.DataFrame, name: str, store: str = "csv", written_rows: int = 0
+) -> None:
+    # written_rows leading rows are already on disk exactly as they'd be
+    # written now, so CSV stages only need the rest appended
+    path = stage_path(name, store)
+    df = apply_schema(df, name)
+    metrics.rows(name, len(df))
+
+    if store == "csv":
+        if written_rows:
+            df.iloc[written_rows:].to_csv(path, mode="a", header=False)
+        else:
+            df.to_csv(path)
+        return
+
+    # Columnar stages drop the row index rather than storing it as a column
+    df = df.reset_index(drop=True)
+    if store == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_feather(path)
+
+
+def stage_columns(name: str, store: str) -> list[str]:
+    path = stage_path(name, store)
+
+    if store == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(path).names
+    if store == "arrow":
+        import pyarrow as pa
+
+        return pa.ipc.open_file(path).schema.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_stage(
+    name: str,
+    store: str = "csv",
+    columns: list[str] | None = None,
+    index_col: int | None = None,
+) -> pd.DataFrame:
+    path = stage_path(name, store)
+
+    if store == "csv":
+        # Only CSV stages carry the previous stage's row index as a column.
+        # Floats are parsed exactly so rewriting a stage reproduces its text
+        df = pd.read_csv(path, index_col=index_col, float_precision="round_trip")
+        return apply_schema(df if columns is None else df[columns], name)
+    if store == "parquet":
+        return apply_schema(pd.read_parquet(path, columns=columns), name)
+    return apply_schema(pd.read_feather(path, columns=columns), name)
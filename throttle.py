@@ -0,0 +1,144 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Responses worth trying again after backing off
+retry_statuses = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    # Retry-After holds either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RequestThrottle:
+    # A token bucket caps the request rate and a limit caps the requests in
+    # flight. Both grow a little with every response that comes back faster
+    # than target_latency and are halved when the server throttles us, fails
+    # or times out, so they settle just under what the server can sustain
+    def __init__(
+        self,
+        rate: float = 4.0,
+        min_rate: float = 0.5,
+        max_rate: float = 32.0,
+        concurrency: float = 2,
+        max_concurrency: int = 8,
+        target_latency: float = 2.0,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 60.0,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+
+        self._lock = threading.Lock()
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_cut = 0.0
+
+    def try_start(self) -> float:
+        # Claims a request slot and returns 0, or returns how long to wait
+        # before asking again
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._in_flight >= int(self.concurrency):
+                return min(0.05, 1 / self.rate)
+
+            burst = max(1.0, self.concurrency)
+            self._tokens = min(burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+
+            self._tokens -= 1
+            self._in_flight += 1
+            self.requests += 1
+            return 0.0
+
+    def wait(self) -> None:
+        while (delay := self.try_start()) > 0:
+            time.sleep(delay)
+
+    async def wait_async(self) -> None:
+        while (delay := self.try_start()) > 0:
+            await asyncio.sleep(delay)
+
+    def succeeded(self, latency: float) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if latency > self.target_latency:
+                # Slow answers are the first sign of an overloaded server
+                self.concurrency = max(1.0, self.concurrency - 1 / self.concurrency)
+                return
+
+            # Additive increase: roughly one more request per second, and one
+            # more in flight, for every full round of fast responses
+            self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+            self.concurrency = min(
+                self.max_concurrency, self.concurrency + 1 / self.concurrency
+            )
+
+    def failed(self, retry_after: float | None = None, throttled: bool = False) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttled += 1
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+            # Requests already in flight fail together, so only cut once for
+            # each burst of failures
+            if now - self._last_cut < self.target_latency:
+                return
+            self._last_cut = now
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.concurrency = max(1.0, self.concurrency / 2)
+
+    def release(self) -> None:
+        # A request abandoned by its caller says nothing about the server
+        with self._lock:
+            self._in_flight -= 1
+
+    def retry_delay(self, attempt: int, retry_after: float | None = None) -> float:
+        # Exponential backoff with full jitter, but never sooner than asked
+        self.retries += 1
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**attempt))
+        return max(delay, retry_after or 0.0)
+
+    def summary(self) -> str:
+        return (
+            f"{self.requests} requests, {self.retries} retries, "
+            f"{self.throttled} throttled; settled at {self.rate:.1f} req/s "
+            f"with {int(self.concurrency)} in flight"
+        )
@@ -1,6 +1,27 @@
-from datetime import datetime
+import contextlib
+import functools
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-from utils import to_seconds, unknown_to_null
+import jobs
+import metrics
+from compact import compact_frame, player_schema, team_schema, to_compact_numeric
+from feature_export import export_features
+from game_store import GameStore
+from stage_store import (
+    apply_schema,
+    read_stage,
+    stage_columns,
+    stage_path,
+    write_stage,
+)
+from utils import unknown_to_null
+
+team_names_url = "https://raw.githubusercontent.com/ColeBallard/historical-nfl-team-names/main/historical-nfl-team-names.csv"
+team_names_file = Path(__file__).parent / "res" / "historical-nfl-team-names.csv"
 
 expanded_cols = {
     "away_att-comp-int": ["away_pass_att", "away_pass_comp", "away_pass_int"],
@@ -76,256 +97,909 @@ percent_columns = [
     "home_third_downs_percent",
 ]
 
+expanded_renames = {
+    "away_rushing": "away_first_downs_rushing",
+    "home_rushing": "home_first_downs_rushing",
+    "away_passing": "away_first_downs_passing",
+    "home_passing": "home_first_downs_passing",
+    "away_penalty": "away_first_downs_penalty",
+    "home_penalty": "home_first_downs_penalty",
+    "away_average_gain": "away_rush_avg",
+    "home_average_gain": "home_rush_avg",
+    "away_avg_yds/att": "away_pass_att_avg",
+    "home_avg_yds/att": "home_pass_att_avg",
+}
+
+possession_columns = ["away_time_of_possession", "home_time_of_possession"]
+
+# Up to three parts split on single dashes, as in "30-20-1" or "5-12-42%"
+composite_pattern = re.compile(r"^([^-]*)(?:-([^-]*))?(?:-([^-]*))?$")
+possession_pattern = re.compile(r"^(\d+):(\d+)$")
+
+preprocess_dropped_cols = [
+    "team",
+    "opponent",
+    "date",
+    "stadium",
+    "current_team",
+    "opp_current_team",
+    "prev_game_index",
+]
+
+stages = [
+    "expanded_team_stats",
+    "expanded_split_team_stats",
+    "staggered_team_stats",
+    "preprocessed_team_stats",
+]
+
+
+# Below this many seasons a run costs more to send to a worker and set up
+# than it takes to transform
+min_seasons_per_worker = 6
+
+player_stages = ["normalized_player_stats", "aggregated_player_stats"]
+
+# Section prefixes of the stat columns in player_stats.csv
+player_stat_prefixes = (
+    "pass_",
+    "rush_",
+    "rec_",
+    "kick_ret_",
+    "punt_ret_",
+    "punt_",
+    "kick_",
+    "kickoff_",
+    "def_",
+    "fum_",
+)
+
+# Per-game rates and longest plays don't add up across games
+player_rate_suffixes = ("_avg", "_ypa", "_rate", "_pct", "_lg")
+
+# Games averaged over by the last-N-game aggregates
+player_recent_games = 5
+
+
+class StageOutOfDate(Exception):
+    pass
+
+
+@functools.cache
+def team_names():
+    # Historical team name -> current team, usable directly with Series.map
+    df = pd.read_csv(team_names_file)
+    return pd.Series(df["CurrentTeam"].to_numpy(), index=df["Team"], name="CurrentTeam")
+
 
 def get_teams():
-    team_names_df = pd.read_csv(
-        "https://raw.githubusercontent.com/ColeBallard/historical-nfl-team-names/main/historical-nfl-team-names.csv"
-    )
+    return team_names().to_dict()
 
-    return {team["Team"]: team["CurrentTeam"] for _, team in team_names_df.iterrows()}
 
+def refresh_team_names():
+    # Replaces the bundled snapshot with the latest published mapping
+    df = pd.read_csv(team_names_url)
+    missing = {"Team", "CurrentTeam"}.difference(df.columns)
+    if missing:
+        raise ValueError(f"Team names are missing columns: {sorted(missing)}")
+    if df["Team"].duplicated().any():
+        raise ValueError("Team names list a team more than once")
 
-def col_one_dash(df):
-    df[columns_with_dashes] = df[columns_with_dashes].replace("--", "-", regex=True)
-    return df
+    tmp_file = team_names_file.with_name(f".{team_names_file.name}.tmp")
+    df[["Team", "CurrentTeam"]].to_csv(tmp_file, index=False)
+    tmp_file.replace(team_names_file)
 
+    team_names.cache_clear()
 
-def col_null_to_zero(df):
-    df[columns_with_possible_nulls] = (
-        df[columns_with_possible_nulls].apply(pd.to_numeric, errors="coerce").fillna(0)
-    )
-    return df
 
+def read_team_stats():
+    return compact_frame(pd.read_csv("team_stats.csv").reset_index(), team_schema)
 
-def col_percent_to_decimal(df):
-    df[percent_columns] = (
-        df[percent_columns].replace("%", "", regex=True).astype(float) / 100
-    )
-    return df
 
+def convert_distinct(values, convert):
+    # Values repeat a lot, so each distinct one is converted once. Missing
+    # values are converted too, so the result takes the dtype converting the
+    # whole column would have given
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    converted = convert(pd.Series(uniques, dtype=object, name=values.name))
+    return pd.Series(converted.to_numpy()[codes], index=values.index, name=values.name)
 
-def separate_team_stats(df):
-    separate_teams = {}
 
-    for team in get_teams():
-        separate_teams[team] = {}
+def split_composites(df):
+    # Every composite column is stacked into one Series, so each distinct
+    # value is matched against composite_pattern once for the whole frame
+    cols = list(expanded_cols)
+    values = pd.concat([df[col].astype(object) for col in cols], ignore_index=True)
+    dashed = np.repeat(np.isin(cols, columns_with_dashes), len(df))
+    values[dashed] = values[dashed].str.replace("--", "-", regex=False)
 
-    for index, row in df.iterrows():
-        month = datetime.strptime(row["date"], "%B %d, %Y").month
+    codes, uniques = pd.factorize(values)
+    parts = pd.Series(uniques, dtype=object).str.extract(composite_pattern)
+    # Missing values have code -1, which picks the extra row of NaN
+    parts = np.vstack([parts.to_numpy(dtype=object), np.full((1, 3), np.nan)])
+    parts = parts[codes].reshape(len(cols), len(df), 3)
 
-        year = datetime.strptime(row["date"], "%B %d, %Y").year
+    return {
+        name: pd.Series(col_parts[:, i], index=df.index)
+        for col, col_parts in zip(cols, parts)
+        for i, name in enumerate(expanded_cols[col])
+    }
 
-        if month >= 1 and month <= 6:
-            year -= 1
 
-        if year not in separate_teams[row["team"]].keys():
-            separate_teams[row["team"]][year] = [row]
+def possession_seconds(values):
+    # "31:25" to 1885
+    parts = values.str.extract(possession_pattern)
+    return pd.to_numeric(parts[0]) * 60 + pd.to_numeric(parts[1])
 
-        else:
-            separate_teams[row["team"]][year].append(row)
 
-    return separate_teams
+def to_percent(values):
+    return values.str.replace("%", "", regex=False).astype(float) / 100
 
 
-def get_win_percentage(index, team, year, separate_team_stats):
-    if index == 0:
-        return None
+def null_to_zero(values):
+    return pd.to_numeric(values, errors="coerce").fillna(0)
 
-    wins = sum(game["outcome"] for game in separate_team_stats[team][year][:index])
-    return wins / index
 
+def to_expanded_column(values, composite):
+    if values.name in percent_columns:
+        return convert_distinct(values, to_percent)
+    if values.name in columns_with_possible_nulls:
+        return convert_distinct(values, null_to_zero)
+    if values.name in possession_columns:
+        return convert_distinct(values, possession_seconds)
+    if composite:
+        return convert_distinct(values, to_compact_numeric)
+    return values
 
-def get_win_streak(index, team, year, separate_team_stats):
-    if index == 0:
-        return 0
 
-    streak = 0
-    for game in separate_team_stats[team][year][:index]:
-        outcome = game["outcome"]
-        if streak >= 1 and outcome == 0 or streak <= -1 and outcome == 1:
-            streak = -streak
-        elif outcome != 0.5:  # Assuming 0.5 is for ties
-            streak = (streak // abs(streak) if streak != 0 else 1) * outcome
+def expand_frame(df):
+    # Composite "a-b-c" columns are replaced by one column per part, added
+    # after the others, and every part is cast straight to its number type
+    parts = split_composites(df)
+    columns = {col: df[col] for col in df.columns if col not in expanded_cols}
 
-    return streak
+    return pd.DataFrame(
+        {
+            col: to_expanded_column(values.rename(col), col in parts)
+            for col, values in {**columns, **parts}.items()
+        },
+        index=df.index,
+    ).rename(columns=expanded_renames)
 
 
-def expand_team_stats():
-    df = pd.read_csv("team_stats.csv").reset_index()
-    export_file = "expanded_team_stats.csv"
+def map_seasons(function, df, seasons, workers=1, pool=None):
+    # Splits df into runs of whole seasons, one per worker, and runs function
+    # on each across a process pool. The rows keep their labels, so results can
+    # be merged back into the order running on every row at once gives
+    unique_seasons = np.sort(seasons.unique())
+    partitions = min(workers, len(unique_seasons) // min_seasons_per_worker)
+    if partitions <= 1:
+        return [function(df)]
 
-    df = col_one_dash(df)
+    runs = np.array_split(unique_seasons, partitions)
+    parts = [df[seasons.isin(run)] for run in runs]
+    if pool is not None:
+        return list(pool.map(function, parts))
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(function, parts))
 
-    for col in expanded_cols:
-        df[expanded_cols[col]] = df[col].str.split("-", expand=True)
 
-        df = df.drop(col, axis=1)
+def merge_rows(parts):
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts).sort_index()
 
-        if "_count" in col:
-            df = df.rename(columns={col: col.replace("_count", "")})
 
-    df["away_time_of_possession"] = df["away_time_of_possession"].apply(to_seconds)
-    df["home_time_of_possession"] = df["home_time_of_possession"].apply(to_seconds)
+def expand_team_stats(store="csv", workers=1, pool=None):
+    raw = read_team_stats()
+    parts = map_seasons(expand_frame, raw, get_seasons(raw["date"]), workers, pool)
 
-    df = df.rename(
-        columns={
-            "away_rushing": "away_first_downs_rushing",
-            "home_rushing": "home_first_downs_rushing",
-            "away_passing": "away_first_downs_passing",
-            "home_passing": "home_first_downs_passing",
-            "away_penalty": "away_first_downs_penalty",
-            "home_penalty": "home_first_downs_penalty",
-            "away_average_gain": "away_rush_avg",
-            "home_average_gain": "home_rush_avg",
-            "away_avg_yds/att": "away_pass_att_avg",
-            "home_avg_yds/att": "home_pass_att_avg",
-        }
-    )
+    write_stage(merge_rows(parts), "expanded_team_stats", store)
+
+
+def split_columns(columns):
+    base_cols = [col for col in columns if "away" not in col and "home" not in col]
+    away_cols = [col for col in columns if "away" in col]
+    home_cols = [col for col in columns if "home" in col]
+    return base_cols, away_cols, home_cols
 
-    df = col_percent_to_decimal(df)
-    df = col_null_to_zero(df)
-
-    df.to_csv(export_file)
-
-
-def split_team_stats():
-    df = pd.read_csv("expanded_team_stats.csv").reset_index()
-    export_file = "expanded_split_team_stats.csv"
-
-    split_objs = []
-
-    for _, row in df.iterrows():
-        if row["away_score"] > row["home_score"]:
-            outcome = 1
-        elif row["away_score"] < row["home_score"]:
-            outcome = 0
-        else:
-            outcome = 0.5
-
-        base_obj = {
-            col: row[col]
-            for col in df.columns
-            if "away" not in col and "home" not in col
-        }
-
-        away_team_obj = {
-            **base_obj,
-            "outcome": outcome,
-            "home_or_away": 1,
-            "team": row["away_team"],
-            "opponent": row["home_team"],
-            "game_index": row["index"],
-            **{
-                col.replace("away", "team"): row[col]
-                for col in df.columns
-                if "away" in col
-            },
-            **{
-                col.replace("home", "opp"): row[col]
-                for col in df.columns
-                if "home" in col
-            },
-        }
-
-        home_team_obj = {
-            **base_obj,
-            "outcome": 1 - outcome,
-            "home_or_away": 0,
-            "team": row["home_team"],
-            "opponent": row["away_team"],
-            "game_index": row["index"],
-            **{
-                col.replace("home", "team"): row[col]
-                for col in df.columns
-                if "home" in col
-            },
-            **{
-                col.replace("away", "opp"): row[col]
-                for col in df.columns
-                if "away" in col
-            },
-        }
-
-        split_objs.extend([away_team_obj, home_team_obj])
-
-    split_df = pd.DataFrame(split_objs)
-
-    # split_df.drop(split_df.columns[[2, 3, 4]], axis=1, inplace=True)
+
+def split_frame(df):
+    base_cols, away_cols, home_cols = split_columns(df.columns)
+
+    away_score = df["away_score"].to_numpy()
+    home_score = df["home_score"].to_numpy()
+    outcome = np.where(
+        away_score > home_score, 1.0, np.where(away_score < home_score, 0.0, 0.5)
+    )
+    # Only a tie makes the outcome fractional
+    if not (outcome == 0.5).any():
+        outcome = outcome.astype(int)
+
+    def half(outcome, home_or_away, team_side, opp_side, team_cols, opp_cols):
+        return pd.concat(
+            [
+                df[base_cols],
+                pd.DataFrame(
+                    {
+                        "outcome": outcome,
+                        "home_or_away": home_or_away,
+                        "team": df[f"{team_side}_team"],
+                        "opponent": df[f"{opp_side}_team"],
+                        "game_index": df["index"],
+                    },
+                    index=df.index,
+                ),
+                df[team_cols].rename(
+                    columns=lambda col: col.replace(team_side, "team")
+                ),
+                df[opp_cols].rename(columns=lambda col: col.replace(opp_side, "opp")),
+            ],
+            axis=1,
+        )
+
+    away_half = half(outcome, 1, "away", "home", away_cols, home_cols)
+    home_half = half(1 - outcome, 0, "home", "away", home_cols, away_cols)
+
+    # Interleave the halves so each game's away row is followed by its home row
+    split_df = pd.concat([away_half, home_half[away_half.columns]], ignore_index=True)
+    order = np.arange(len(split_df)).reshape(2, -1).T.ravel()
+    split_df = split_df.iloc[order].reset_index(drop=True)
 
     split_df["attendance"] = split_df["attendance"].apply(unknown_to_null)
 
-    split_df.to_csv(export_file)
+    return split_df
+
+
+def split_rows(df):
+    # A game's away and home rows are labelled 2 * game and 2 * game + 1,
+    # however the games were picked out
+    split_df = split_frame(df)
+    split_df.index = np.column_stack([2 * df.index, 2 * df.index + 1]).ravel()
+    return split_df
+
+
+def split_team_stats(store="csv", workers=1, pool=None):
+    df = read_stage("expanded_team_stats", store).reset_index()
+
+    parts = map_seasons(split_rows, df, get_seasons(df["date"]), workers, pool)
+    split_df = merge_rows(parts)
 
+    write_stage(split_df, "expanded_split_team_stats", store)
+    store_games(split_df)
 
-def stagger_team_stats():
-    df = pd.read_csv("expanded_split_team_stats.csv").reset_index()
+
+def game_store_rows(df):
     team_dict = get_teams()
-    export_file = "staggered_team_stats.csv"
-
-    separate_teams = separate_team_stats(df)
-    separate_teams_list = []
-
-    for team, years in separate_teams.items():
-        for year, games in years.items():
-            for index, game in enumerate(games[:-1]):  # Skip the last game
-                next_game = games[index + 1]
-                game.update({
-                    "outcome": next_game["outcome"],
-                    "home_or_away": next_game["home_or_away"],
-                    "postseason": next_game["postseason"],
-                    "opponent": next_game["opponent"],
-                    "date": next_game["date"],
-                    "stadium": next_game["stadium"],
-                    "current_team": team_dict[game["team"]],
-                    "opp_current_team": team_dict[next_game["opponent"]],
-                    "team_win_pct": get_win_percentage(index, team, year, separate_teams),
-                    "opp_win_pct": get_win_percentage(index, next_game["opponent"], year, separate_teams),
-                    "team_win_streak": get_win_streak(index, team, year, separate_teams),
-                    "opp_win_streak": get_win_streak(index, next_game["opponent"], year, separate_teams)
-                })
-                separate_teams_list.append(game)
-
-    separate_df = pd.DataFrame(separate_teams_list)
-
-    # Rename specific columns
-    columns_to_rename = {col: f"prev_{col}" for col in separate_df.columns[9:103]}
-    separate_df.rename(columns=columns_to_rename, inplace=True)
+    return df.assign(
+        date=to_dates(df["date"], format="%B %d, %Y").dt.strftime("%Y-%m-%d"),
+        season=get_seasons(df["date"]),
+        current_team=df["team"].map(team_dict),
+        opp_current_team=df["opponent"].map(team_dict),
+    )
+
+
+def store_games(split_df, rows=None, stored_rows=0):
+    # Mirrors the split stage into games.db for indexed lookups. When the
+    # store holds the stage's previous stored_rows rows, only rows are written
+    games = GameStore()
+    try:
+        if rows is not None and games.count() == stored_rows:
+            try:
+                games.upsert(game_store_rows(split_df.loc[rows]))
+                return
+            except ValueError:
+                pass
+        games.rebuild(game_store_rows(split_df))
+    finally:
+        games.close()
+
+
+def to_dates(dates, format=None):
+    # to_datetime hands categorical dates back as categoricals, without .dt
+    return pd.to_datetime(dates.astype(object), format=format)
+
+
+def get_seasons(dates):
+    dates = to_dates(dates, format="%B %d, %Y")
+    # Games from January to June belong to the previous season
+    return dates.dt.year - (dates.dt.month <= 6)
+
+
+def prev_columns(columns):
+    # Stats describing the game just played, as opposed to the upcoming one
+    return [
+        col
+        for col in columns
+        if col in ("attendance", "overtime", "game_index")
+        or col.startswith(("team_", "opp_"))
+    ]
+
+
+def win_streak_states(outcome, group):
+    # Streak after each game: a win sets it to 1, a loss right after a win
+    # flips it to -1, any other loss resets it to 0 and ties leave it alone
+    decided = outcome != 0.5
+    prev_decided = outcome[decided].groupby(group[decided]).shift(1)
+    states = pd.Series(np.nan, index=outcome.index)
+    states[decided] = np.where(
+        outcome[decided] == 1, 1, np.where(prev_decided == 1, -1, 0)
+    )
+    return states.groupby(group).ffill().fillna(0)
+
+
+def form_columns(columns):
+    return [
+        col
+        for col in prev_columns(columns)
+        if col.startswith(("team_", "opp_")) and col not in ("team_team", "opp_team")
+    ]
+
+
+def form_names(columns, windows=(), spans=()):
+    stats = form_columns(columns)
+    return [f"last{n}_{col}" for n in windows for col in stats] + [
+        f"ewm{span}_{col}" for span in spans for col in stats
+    ]
+
+
+def form_features(stats, group, position, windows=(), spans=()):
+    # Means over each team's last N games and exponentially weighted means,
+    # within a season and up to and including each game. Games are laid out as
+    # (team season, game, stat), so every window comes from one cumulative sum
+    # and every span from one pass over the game positions. Missing stats are
+    # skipped, as rolling(min_periods=1) and ewm(span) would
+    if any(n < 1 for n in [*windows, *spans]):
+        raise ValueError("Windows and spans must be at least 1")
+
+    codes = group.to_numpy()
+    pos = position.to_numpy()
+    values = stats.to_numpy(dtype=np.float64)
+    shape = (codes.max() + 1, pos.max() + 1, values.shape[1])
+
+    present = np.zeros(shape)
+    present[codes, pos] = ~np.isnan(values)
+    padded = np.zeros(shape)
+    padded[codes, pos] = np.nan_to_num(values)
+
+    features = []
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if windows:
+            totals = np.pad(padded.cumsum(axis=1), ((0, 0), (1, 0), (0, 0)))
+            counts = np.pad(present.cumsum(axis=1), ((0, 0), (1, 0), (0, 0)))
+            for n in windows:
+                start = np.maximum(pos + 1 - n, 0)
+                means = (totals[codes, pos + 1] - totals[codes, start]) / (
+                    counts[codes, pos + 1] - counts[codes, start]
+                )
+                features.append(means)
+
+        if spans:
+            decay = (1 - 2 / (np.array(spans, dtype=np.float64) + 1))[:, None, None]
+            weighted = np.zeros((len(spans), shape[0], shape[2]))
+            weights = np.zeros_like(weighted)
+            means = np.empty((len(spans), *shape))
+            for i in range(shape[1]):
+                weighted = decay * weighted + padded[:, i]
+                weights = decay * weights + present[:, i]
+                means[:, :, i] = weighted / weights
+            features.extend(means[:, codes, pos])
+
+    return pd.DataFrame(
+        np.hstack([np.empty((len(stats), 0)), *features]),
+        columns=form_names(stats.columns, windows, spans),
+        index=stats.index,
+    )
+
+
+def stagger_frame(df, team_dict, windows=(), spans=()):
+    unknown_teams = set(df["team"]).union(df["opponent"]).difference(team_dict)
+    if unknown_teams:
+        raise KeyError(f"Unknown teams: {sorted(unknown_teams)}")
+
+    season = get_seasons(df["date"])
+
+    # Order rows by team, then season, then game, as the per-team lists did
+    team_rank = df["team"].map({team: rank for rank, team in enumerate(team_dict)})
+    group = df.groupby([df["team"], season], sort=False, observed=True).ngroup()
+    order = np.lexsort((np.arange(len(df)), group.to_numpy(), team_rank.to_numpy()))
+
+    games = df.iloc[order].reset_index(drop=True)
+    season = season.iloc[order].reset_index(drop=True)
+    group = group.iloc[order].reset_index(drop=True)
+    outcome = games["outcome"].astype(float)
+
+    position = games.groupby(group).cumcount()
+    group_size = group.map(group.value_counts())
+
+    # Wins and streak state after each game, looked up by (team, season, game)
+    wins_after = outcome.groupby(group).cumsum()
+    streak_after = win_streak_states(outcome, group)
+    key = pd.MultiIndex.from_arrays([games["team"], season, position])
+    wins_lookup = pd.Series(wins_after.to_numpy(), index=key)
+    streak_lookup = pd.Series(streak_after.to_numpy(), index=key)
+    season_sizes = group_size.groupby([games["team"], season], observed=True).first()
+
+    form = form_features(
+        games[form_columns(games.columns)], group, position, windows, spans
+    )
+
+    # Every game except a team's last of the season gets the next game's info
+    current = np.flatnonzero(position.to_numpy() < group_size.to_numpy() - 1)
+    upcoming = current + 1
+
+    staggered = games.iloc[current].reset_index(drop=True)
+    for col in ["outcome", "home_or_away", "postseason", "opponent", "date", "stadium"]:
+        staggered[col] = games[col].iloc[upcoming].to_numpy()
+
+    index = position.iloc[current].to_numpy()
+    team_season = pd.MultiIndex.from_arrays([staggered["team"], season.iloc[current]])
+    opp_season = pd.MultiIndex.from_arrays(
+        [staggered["opponent"], season.iloc[current]]
+    )
+
+    def record(team_season, games_played):
+        # Win % and streak over a team's first `games_played` games
+        last_game = pd.MultiIndex.from_arrays(
+            [
+                team_season.get_level_values(0),
+                team_season.get_level_values(1),
+                games_played - 1,
+            ]
+        )
+        wins = wins_lookup.reindex(last_game).to_numpy()
+        streak = streak_lookup.reindex(last_game).to_numpy()
+        played = games_played > 0
+        return (
+            np.where(played, wins, 0) / np.where(index > 0, index, np.nan),
+            # Streaks take the outcome's dtype, which is only float with ties
+            np.where(played, streak, 0).astype(games["outcome"].dtype),
+        )
+
+    team_win_pct, team_win_streak = record(team_season, index)
+    # Opponents are looked up at the same game index, capped at the number of
+    # games they played that season
+    opp_games = np.minimum(index, season_sizes.reindex(opp_season).to_numpy())
+    opp_win_pct, opp_win_streak = record(opp_season, opp_games)
+
+    staggered = staggered.rename(
+        columns={col: f"prev_{col}" for col in prev_columns(staggered.columns)}
+    )
+    staggered["current_team"] = staggered["team"].map(team_dict)
+    staggered["opp_current_team"] = staggered["opponent"].map(team_dict)
+    staggered["team_win_pct"] = team_win_pct
+    staggered["opp_win_pct"] = opp_win_pct
+    staggered["team_win_streak"] = team_win_streak
+    staggered["opp_win_streak"] = opp_win_streak
+    staggered = pd.concat(
+        [staggered, form.iloc[current].reset_index(drop=True)], axis=1
+    )
 
     # Reorder column
-    cols = [col for col in separate_df.columns if col != "prev_game_index"] + ["prev_game_index"]
-    separate_df = separate_df[cols]
+    cols = [col for col in staggered.columns if col != "prev_game_index"]
+    return staggered[cols + ["prev_game_index"]]
 
-    separate_df.to_csv(export_file)
 
+def merge_staggered(parts, df, season, team_dict):
+    # Puts rows staggered season by season in the order staggering everything
+    # at once gives: by team, then by when each team season first appears in
+    # df, then as they were
+    staggered = pd.concat(parts, ignore_index=True)
 
+    group = df.groupby([df["team"], season], sort=False, observed=True).ngroup()
+    group = pd.Series(
+        group.to_numpy(), index=pd.MultiIndex.from_arrays([df["team"], season])
+    )
+    group = group[~group.index.duplicated()]
 
-def preprocess_team_stats():
-    df = pd.read_csv("staggered_team_stats.csv").reset_index()
-    export_file = "preprocessed_team_stats.csv"
+    keys = pd.MultiIndex.from_arrays(
+        [staggered["team"], get_seasons(staggered["date"])]
+    )
+    team_rank = staggered["team"].map(
+        {team: rank for rank, team in enumerate(team_dict)}
+    )
+    order = np.lexsort(
+        (
+            np.arange(len(staggered)),
+            group.reindex(keys).to_numpy(),
+            team_rank.to_numpy(),
+        )
+    )
+    return staggered.iloc[order].reset_index(drop=True)
 
-    df["date"] = pd.to_datetime(df["date"])
+
+def stagger_team_stats(store="csv", windows=(), spans=(), workers=1, pool=None):
+    df = read_stage("expanded_split_team_stats", store, index_col=0)
+    team_dict = get_teams()
+
+    # Win % and streaks never look outside a season, and neither do the form
+    # features
+    season = get_seasons(df["date"])
+    stagger = functools.partial(
+        stagger_frame, team_dict=team_dict, windows=windows, spans=spans
+    )
+    parts = map_seasons(stagger, df, season, workers, pool)
+    if len(parts) == 1:
+        separate_df = parts[0]
+    else:
+        separate_df = merge_staggered(parts, df, season, team_dict)
+
+    write_stage(separate_df, "staggered_team_stats", store)
+
+
+def preprocess_frame(df):
+    df["date"] = to_dates(df["date"])
     ref_date = pd.to_datetime("1978-01-01")
     df["recency"] = (df["date"] - ref_date).dt.days
     df["prev_overtime"] = df["prev_overtime"].astype(int)
 
-    df = df.drop(
+    return df.drop(
+        [col for col in preprocess_dropped_cols if col in df.columns], axis=1
+    )
+
+
+def preprocess_team_stats(store="csv"):
+    # Columnar stages can skip reading the dropped columns altogether
+    columns = None
+    if store != "csv":
+        columns = [
+            col
+            for col in stage_columns("staggered_team_stats", store)
+            if col == "date" or col not in preprocess_dropped_cols
+        ]
+
+    df = read_stage("staggered_team_stats", store, columns, index_col=0)
+
+    write_stage(preprocess_frame(df), "preprocessed_team_stats", store)
+
+
+def read_player_stats():
+    return compact_frame(pd.read_csv("player_stats.csv", index_col=0), player_schema)
+
+
+def player_stat_columns(columns):
+    return [col for col in columns if col.startswith(player_stat_prefixes)]
+
+
+def parse_stat(text):
+    # A touchdown long reads like "75t" and a stat nobody recorded like "--"
+    text = text.str.replace(",", "").str.rstrip("t")
+    return pd.to_numeric(text, errors="coerce").astype("float32")
+
+
+def to_stat(values):
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype("float32")
+    return convert_distinct(values.astype(str), parse_stat)
+
+
+def normalize_player_frame(df):
+    keys = pd.DataFrame(
+        {
+            "player": df["player"],
+            "team": df["team"],
+            "date": df["date"],
+            "season": get_seasons(df["date"]),
+        },
+        index=df.index,
+    )
+    stats = pd.DataFrame(
+        {col: to_stat(df[col]) for col in player_stat_columns(df.columns)},
+        index=df.index,
+    )
+
+    # Names aren't unique across the league, so a player is keyed by team too.
+    # Each player's games end up together and in the order they were played
+    dates = to_dates(df["date"], format="%B %d, %Y")
+    order = np.lexsort(
+        (
+            dates.to_numpy(),
+            df["team"].astype("category").cat.codes.to_numpy(),
+            df["player"].astype("category").cat.codes.to_numpy(),
+        )
+    )
+
+    return pd.concat([keys, stats], axis=1).iloc[order].reset_index(drop=True)
+
+
+def aggregate_player_frame(df, recent_games=player_recent_games):
+    # Season-to-date totals and last-N-game averages, covering only the games
+    # before each row so a row never includes its own game. Rows come grouped
+    # by player and in date order, so every aggregate is a difference of one
+    # running total
+    total_cols = [
+        col
+        for col in player_stat_columns(df.columns)
+        if not col.endswith(player_rate_suffixes)
+    ]
+    values = df[total_cols].fillna(0).to_numpy(dtype=np.float64)
+    running = np.vstack([np.zeros((1, len(total_cols))), values.cumsum(axis=0)])
+
+    rows = np.arange(len(df))
+    player = df.groupby(["player", "team"], sort=False, observed=True)
+    season = df.groupby(["player", "team", "season"], sort=False, observed=True)
+    player_start = rows - player.cumcount().to_numpy()
+    season_start = rows - season.cumcount().to_numpy()
+    recent_start = np.maximum(player_start, rows - recent_games)
+
+    season_totals = running[rows] - running[season_start]
+    recent_totals = running[rows] - running[recent_start]
+    recent_played = rows - recent_start
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # A player's first game has nothing before it to average
+        recent_means = recent_totals / recent_played[:, None]
+
+    return pd.concat(
         [
-            "team",
-            "opponent",
-            "date",
-            "stadium",
-            "current_team",
-            "opp_current_team",
-            "prev_game_index",
+            df[["player", "team", "date", "season"]],
+            pd.DataFrame(
+                {
+                    "season_games": rows - season_start,
+                    f"last{recent_games}_games": recent_played,
+                },
+                index=df.index,
+            ),
+            pd.DataFrame(
+                season_totals,
+                columns=[f"season_{col}" for col in total_cols],
+                index=df.index,
+            ),
+            pd.DataFrame(
+                recent_means,
+                columns=[f"last{recent_games}_{col}" for col in total_cols],
+                index=df.index,
+            ),
         ],
         axis=1,
     )
 
-    df.to_csv(export_file)
+
+def normalize_player_stats(store="csv"):
+    df = normalize_player_frame(read_player_stats())
+
+    write_stage(df, "normalized_player_stats", store)
+
+
+def aggregate_player_stats(store="csv"):
+    df = read_stage("normalized_player_stats", store, index_col=0)
+
+    write_stage(aggregate_player_frame(df), "aggregated_player_stats", store)
+
+
+@metrics.run("perform_player_transformations")
+def perform_player_transformations(store="csv"):
+    for stage, transform in [
+        ("Normalizing players", normalize_player_stats),
+        ("Aggregating players", aggregate_player_stats),
+    ]:
+        jobs.check_cancelled()
+        jobs.report(stage=stage)
+        with metrics.stage(stage):
+            transform(store)
+
+
+@metrics.run("perform_all_transformations")
+def perform_all_transformations(
+    store="csv", windows=(), spans=(), workers=1, features_dir=None
+):
+    # windows and spans add means over each team's last N games and
+    # exponentially weighted means with the given spans to the staggered stage.
+    # With more than one worker, expanding, splitting and staggering run on
+    # runs of whole seasons across a process pool and come out the same.
+    # features_dir also exports the preprocessed stage there as .npy arrays.
+    # Without a state file the next update rebuilds everything, so stopping
+    # between stages can never leave them out of step with each other
+    stage_path("transform_state", store).unlink(missing_ok=True)
+
+    pool_context = (
+        ProcessPoolExecutor(workers) if workers > 1 else contextlib.nullcontext()
+    )
+    with pool_context as pool:
+        parallel = {"workers": workers, "pool": pool}
+        for stage, transform in [
+            ("Expanding", functools.partial(expand_team_stats, **parallel)),
+            ("Splitting", functools.partial(split_team_stats, **parallel)),
+            (
+                "Staggering",
+                functools.partial(
+                    stagger_team_stats, windows=windows, spans=spans, **parallel
+                ),
+            ),
+            # Preprocessing is a few column operations, cheaper than sending
+            # the stage to the workers
+            ("Preprocessing", preprocess_team_stats),
+        ]:
+            jobs.check_cancelled()
+            jobs.report(stage=stage)
+            with metrics.stage(stage):
+                transform(store)
+
+    if features_dir is not None:
+        with metrics.stage("Exporting features"):
+            export_features(store, features_dir)
+
+    write_stage(game_fingerprints(read_team_stats()), "transform_state", store)
+
+
+def game_fingerprints(df):
+    # One hash per scraped game, covering every value the stages read from it
+    return pd.DataFrame({"fingerprint": pd.util.hash_pandas_object(df, index=False)})
+
+
+def changed_games(fingerprints, store):
+    # Positions of games added or changed since the stages were last built, or
+    # None when they have to be rebuilt from scratch
+    if not all(stage_path(name, store).exists() for name in stages):
+        return None
+    if not stage_path("transform_state", store).exists():
+        return None
+
+    previous = read_stage("transform_state", store, index_col=0)["fingerprint"]
+    current = fingerprints["fingerprint"]
+    if len(previous) > len(current):
+        return None
+
+    differs = current.to_numpy()[: len(previous)] != previous.to_numpy()
+    return np.concatenate(
+        [np.flatnonzero(differs), np.arange(len(previous), len(current))]
+    )
+
+
+def splice_rows(old, new, total):
+    # Replaces rows of a stage by index, adding any the stage doesn't have yet.
+    # Also returns how many leading rows were left exactly as they were
+    if list(new.columns) != list(old.columns):
+        raise StageOutOfDate("Stage columns changed")
+
+    df = pd.concat([old.drop(new.index, errors="ignore"), new]).sort_index()
+    if not df.index.equals(pd.RangeIndex(total)):
+        raise StageOutOfDate("Stage rows don't match the scraped games")
+
+    # Columns falling back to object keep each value's text, but any other
+    # change of dtype reformats the rows already written
+    retyped = (df.dtypes != old.dtypes) & (df.dtypes != object)
+    appended = new.index.min() >= len(old) and not retyped.any()
+    return df, len(old) if appended else 0
+
+
+def team_seasons(df):
+    return set(zip(df["team"], get_seasons(df["date"])))
+
+
+def in_team_seasons(df, groups):
+    keys = pd.MultiIndex.from_arrays([df["team"], get_seasons(df["date"])])
+    return keys.isin(list(groups))
+
+
+def update_expanded(raw, changed, store):
+    old = read_stage("expanded_team_stats", store, index_col=0)
+    # Spliced rows need the stage's dtypes, or the whole column is retyped
+    new = apply_schema(expand_frame(raw.iloc[changed].copy()), "expanded_team_stats")
+
+    df, written_rows = splice_rows(old, new, len(raw))
+
+    write_stage(df, "expanded_team_stats", store, written_rows)
+
+
+def update_split(changed, store):
+    expanded = read_stage("expanded_team_stats", store).reset_index()
+    old = read_stage("expanded_split_team_stats", store, index_col=0)
+
+    new = apply_schema(split_rows(expanded.iloc[changed]), "expanded_split_team_stats")
+
+    split_df, written_rows = splice_rows(old, new, 2 * len(expanded))
+
+    write_stage(split_df, "expanded_split_team_stats", store, written_rows)
+    store_games(split_df, new.index, len(old))
+
+    # A changed game may have moved to a different team or season
+    replaced = old.loc[old.index.intersection(new.index)]
+    return team_seasons(replaced) | team_seasons(new)
+
+
+def update_staggered(groups, store, windows=(), spans=()):
+    df = read_stage("expanded_split_team_stats", store, index_col=0)
+    team_dict = get_teams()
+
+    # Win % and streaks only ever look within a season, so the affected
+    # seasons are all that needs to be staggered again
+    season = get_seasons(df["date"])
+    season_df = df[season.isin({season for _, season in groups})]
+
+    # Groups facing an affected team read its record, so they change too
+    opponents = pd.MultiIndex.from_arrays(
+        [season_df["opponent"], get_seasons(season_df["date"])]
+    )
+    groups = groups | team_seasons(season_df[opponents.isin(list(groups))])
+
+    new = stagger_frame(season_df, team_dict, windows, spans)
+    new = new[in_team_seasons(new, groups)]
+
+    old = read_stage("staggered_team_stats", store, index_col=0)
+    old_preprocessed = read_stage("preprocessed_team_stats", store, index_col=0)
+    if len(old) != len(old_preprocessed):
+        raise StageOutOfDate("Staggered and preprocessed stages differ in length")
+    if list(new.columns) != list(old.columns):
+        raise StageOutOfDate("Stage columns changed")
+
+    kept = ~in_team_seasons(old, groups)
+    staggered = pd.concat([old[kept], new], ignore_index=True)
+    preprocessed = pd.concat(
+        [old_preprocessed[kept], preprocess_frame(new.copy())], ignore_index=True
+    )
+
+    # Rows stay grouped by team, then season, then game
+    team_rank = staggered["team"].map(
+        {team: rank for rank, team in enumerate(team_dict)}
+    )
+    order = np.lexsort(
+        (
+            np.arange(len(staggered)),
+            get_seasons(staggered["date"]).to_numpy(),
+            team_rank.to_numpy(),
+        )
+    )
+
+    write_stage(
+        staggered.iloc[order].reset_index(drop=True), "staggered_team_stats", store
+    )
+    write_stage(
+        preprocessed.iloc[order].reset_index(drop=True),
+        "preprocessed_team_stats",
+        store,
+    )
 
 
-def perform_all_transformations():
-    expand_team_stats()
-    split_team_stats()
-    stagger_team_stats()
-    preprocess_team_stats()
+def has_form(store, windows, spans):
+    expected = form_names(
+        stage_columns("expanded_split_team_stats", store), windows, spans
+    )
+    built = [
+        col
+        for col in stage_columns("staggered_team_stats", store)
+        if re.match(r"(last|ewm)\d+_", col)
+    ]
+    return built == expected
+
+
+@metrics.run("update_transformations")
+def update_transformations(
+    store="csv", windows=(), spans=(), workers=1, features_dir=None
+):
+    # Brings every stage up to date with team_stats.csv, recomputing only the
+    # games added or changed since the last run. A different choice of windows
+    # and spans than the stages were built with rebuilds them all
+    raw = read_team_stats()
+    fingerprints = game_fingerprints(raw)
+
+    changed = changed_games(fingerprints, store)
+    if changed is not None and not has_form(store, windows, spans):
+        changed = None
+    try:
+        if changed is not None and len(changed):
+            stage_path("transform_state", store).unlink(missing_ok=True)
+            jobs.report(stage="Expanding", games=len(changed))
+            with metrics.stage("Expanding"):
+                update_expanded(raw, changed, store)
+            jobs.check_cancelled()
+            jobs.report(stage="Splitting")
+            with metrics.stage("Splitting"):
+                groups = update_split(changed, store)
+            jobs.check_cancelled()
+            jobs.report(stage="Staggering and preprocessing")
+            with metrics.stage("Staggering and preprocessing"):
+                update_staggered(groups, store, windows, spans)
+    except StageOutOfDate:
+        changed = None
+
+    if changed is None:
+        perform_all_transformations(store, windows, spans, workers, features_dir)
+        return
+
+    if features_dir is not None and (
+        len(changed) or not (Path(features_dir) / "manifest.json").exists()
+    ):
+        with metrics.stage("Exporting features"):
+            export_features(store, features_dir)
+
+    write_stage(fingerprints, "transform_state", store)